@@ -0,0 +1,80 @@
+# app/bench_decode.py
+# -------------------------------------------------------------------------
+# Benchmark do decode das imagens de câmara (por frame):
+#   full    → Image.open().convert("RGB") + warp (caminho antigo)
+#   reduced → decode_for_rois() (draft JPEG + bbox das ROIs) + warp
+#
+# Uso:
+#   python -m app.bench_decode frontend/exec/src/media/*.jpg --min-side 512
+# O camera_id vem do nome do ficheiro (ex.: 6371.jpg), como no agente.
+# -------------------------------------------------------------------------
+
+import argparse, io, json, os, statistics, time
+from PIL import Image
+
+from .snip import warp_quad_to_bytes, decode_for_rois, map_quad
+
+
+def _rois_for(plan: dict, path: str):
+    cam_id = os.path.splitext(os.path.basename(path))[0]
+    cams = plan.get("Frutas e Legumes", plan).get("cameras", {})
+    prods = (cams.get(cam_id) or {}).get("products", [])
+    return [p["image_coordinates"] for p in prods if p.get("image_coordinates")]
+
+def _buf_bytes(pil: Image.Image) -> int:
+    return pil.size[0] * pil.size[1] * len(pil.getbands())
+
+def _run_full(data: bytes, quads):
+    pil = Image.open(io.BytesIO(data)).convert("RGB")
+    for q in quads:
+        warp_quad_to_bytes(pil, q)
+    return _buf_bytes(pil)
+
+def _run_reduced(data: bytes, quads, min_side: int):
+    pil, origin, factor = decode_for_rois(data, quads, min_side=min_side)
+    for q in quads:
+        warp_quad_to_bytes(pil, map_quad(q, origin, factor))
+    return _buf_bytes(pil)
+
+def _measure(fn, repeat: int):
+    # memória: tamanho do buffer de píxeis descodificado (o Pillow aloca fora
+    # do heap Python, por isso tracemalloc não o vê)
+    times, buf = [], 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        buf = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), buf
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("images", nargs="+")
+    ap.add_argument("--plan", default="utils/plantest.json")
+    ap.add_argument("--min-side", type=int, default=512)
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    with open(args.plan, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+
+    print(f"{'imagem':<16}{'modo':<9}{'ms/frame':>10}{'buffer KiB':>12}")
+    for path in args.images:
+        quads = _rois_for(plan, path)
+        if not quads:
+            print(f"[BENCH] {path}: câmara sem ROIs no planograma, ignorada.")
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+
+        runs = {
+            "full":    lambda: _run_full(data, quads),
+            "reduced": lambda: _run_reduced(data, quads, args.min_side),
+        }
+        name = os.path.basename(path)
+        for mode, fn in runs.items():
+            ms, buf = _measure(fn, args.repeat)
+            print(f"{name:<16}{mode:<9}{ms:>10.1f}{buf / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
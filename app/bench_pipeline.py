@@ -0,0 +1,151 @@
+# app/bench_pipeline.py
+# -------------------------------------------------------------------------
+# Benchmark end-to-end do agente SEM Azure:
+#   - Blob: container em memória (ou Azurite/real com --blob env)
+#   - Azure OpenAI: servidor HTTP local (app/fakes.py) com latência,
+#     429s e tamanho de resposta configuráveis
+#   - Imagens sintéticas geradas a partir de utils/plantest.json
+# Corre run_for_all_images() tal como em produção (ou o modo bulk com
+# --bulk) e reporta imagens/min, percentis por etapa e pico de RSS.
+#
+# Uso:
+#   python -m app.bench_pipeline --images 28 --latency 1.2 --jitter 0.6 --p429 0.05
+# -------------------------------------------------------------------------
+
+import argparse, base64, json, os, resource, sys, tempfile, time
+
+from .fakes import FakeContainerClient, FakeVisionServer, synth_shelf_image
+
+PLAN_BLOB = "planogramas/plantest.json"
+
+
+def _set_env(args, endpoint: str):
+    """Configura o ambiente ANTES de importar app.env (lido no import)."""
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_DEPLOYMENT": "bench",
+        "AZURE_OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_API_VERSION": "2024-12-01-preview",
+        "ROI_JSON_BLOB": PLAN_BLOB,
+        "WORK_QUEUE_URL": "",
+        "WIRE_FORMAT": args.wire_format,
+        "OAI_ROI_BATCH": str(args.roi_batch),
+        "OAI_MAX_RETRIES": str(args.max_retries),
+        "CROP_MIN_SIDE": str(args.min_side),
+        "TRIAGE_ENABLED": "1" if args.triage else "0",
+        "STREAM_DETECTIONS": "1" if args.stream else "0",
+        "BACKEND_INGEST_URL": endpoint + "ingest",
+    })
+    if args.blob == "memory":
+        key = base64.b64encode(b"bench-key").decode()
+        os.environ.update({
+            "AZURE_STORAGE_CONNECTION_STRING":
+                f"DefaultEndpointsProtocol=http;AccountName=bench;AccountKey={key};"
+                f"BlobEndpoint=http://127.0.0.1:10000/bench;",
+            "AZURE_STORAGE_KEY": key,
+            "BLOB_CONTAINER": "hackathon",
+        })
+
+def _seed_blobs(blob_io, plan: dict, n_images: int, seed: int):
+    cams = plan.get("Frutas e Legumes", plan).get("cameras", {})
+    cam_ids = sorted(cams)
+    items = [(PLAN_BLOB, json.dumps(plan).encode("utf-8"), "application/json")]
+    for i in range(n_images):
+        cam = cam_ids[i % len(cam_ids)]
+        # nome da imagem = número da câmara; lojas diferentes em "pastas"
+        name = f"loja{i // len(cam_ids):03d}/{cam}.jpg"
+        img = synth_shelf_image(cams[cam].get("products", []), seed=seed + i)
+        items.append((name, img, "image/jpeg"))
+    blob_io.upload_bytes_many(items)
+
+def _peak_rss_mb() -> float:
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / (1024 * 1024)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plan", default="utils/plantest.json")
+    ap.add_argument("--images", type=int, default=14)
+    ap.add_argument("--blob", choices=("memory", "env"), default="memory",
+                    help="memory = container em memória; env = AZURE_STORAGE_CONNECTION_STRING (ex.: Azurite)")
+    ap.add_argument("--blob-latency", type=float, default=0.0, help="s por operação no blob em memória")
+    ap.add_argument("--latency", type=float, default=0.5, help="s por pedido ao modelo")
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--pad", type=int, default=0, help="chars extra por detecção na resposta")
+    ap.add_argument("--roi-batch", type=int, default=4)
+    ap.add_argument("--max-retries", type=int, default=6)
+    ap.add_argument("--min-side", type=int, default=0)
+    ap.add_argument("--wire-format", default="json")
+    ap.add_argument("--triage", action="store_true", help="ativa a triagem local (app/triage.py)")
+    ap.add_argument("--stream", action="store_true", help="streaming + emissão antecipada para um /ingest local")
+    ap.add_argument("--bulk", action="store_true", help="modo bulk (app/bulk.py) contra a Batch API local")
+    ap.add_argument("--batch-delay", type=float, default=1.0, help="s até cada batch ficar completo (--bulk)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default="", help="grava o relatório em JSON")
+    args = ap.parse_args()
+
+    with open(args.plan, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+
+    server = FakeVisionServer(args.latency, args.jitter, args.p429, args.pad, seed=args.seed,
+                              batch_delay_s=args.batch_delay).start()
+    _set_env(args, server.endpoint)
+
+    # imports só depois do ambiente configurado
+    from . import blob_io, metrics
+    from . import main as agent
+    if args.blob == "memory":
+        blob_io.container_client = FakeContainerClient(latency_s=args.blob_latency)
+
+    _seed_blobs(blob_io, plan, args.images, args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="hotshelf-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)        # data/input e data/outputs ficam isolados
+    try:
+        metrics.reset()
+        t0 = time.perf_counter()
+        if args.bulk:
+            from . import bulk
+            bulk.run(poll_seconds=0.2)
+        else:
+            agent.run_for_all_images()
+        agent.close_emitter()
+        elapsed = time.perf_counter() - t0
+    finally:
+        os.chdir(cwd)
+        server.stop()
+
+    counters = metrics.counters()
+    stages = metrics.summary()
+    images = counters.get("images", 0)
+    report = {
+        "images": images,
+        "elapsed_s": elapsed,
+        "images_per_min": images / elapsed * 60 if elapsed else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "counters": counters,
+        "model_server": server.stats,
+        "stages": stages,
+        "workdir": workdir,
+    }
+
+    print("\n================ BENCHMARK ================")
+    print(f"imagens: {images} em {elapsed:.1f}s → {report['images_per_min']:.1f} imagens/min")
+    print(f"pico RSS: {report['peak_rss_mb']:.0f} MB")
+    print(f"contadores: {counters}")
+    print(f"servidor modelo: {server.stats}")
+    print(f"\n{'etapa':<14}{'n':>6}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, st in sorted(stages.items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"{name:<14}{st['n']:>6}{st['total_s']:>10.2f}{st['p50_ms']:>10.1f}"
+              f"{st['p95_ms']:>10.1f}{st['p99_ms']:>10.1f}{st['max_ms']:>10.1f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nrelatório → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import mimetypes
 from datetime import datetime, timedelta
 from typing import Iterable, List, Tuple
 
+from azure.core.exceptions import ResourceExistsError
 from azure.storage.blob import (
     BlobServiceClient,
     BlobSasPermissions,
@@ -88,6 +89,51 @@ def upload_bytes_many(
         uploaded.append(path)
     return uploaded
 
+def upload_if_absent(
+    items: Iterable[Tuple[str, bytes, str]]
+) -> List[str]:
+    """
+    Como upload_bytes_many, mas com PUT condicional (overwrite=False →
+    If-None-Match: *): um blob que já exista não é reescrito.
+    Devolve só os paths efectivamente criados.
+    """
+    created: List[str] = []
+    for path, data, content_type in items:
+        bc = container_client.get_blob_client(path)
+        try:
+            bc.upload_blob(data, overwrite=False, content_type=content_type)
+        except ResourceExistsError:
+            continue
+        created.append(path)
+    return created
+
+# -------------------------------------------------------------------------
+# Listagem com metadados / remoção em lote (compactação dos crops)
+# -------------------------------------------------------------------------
+def list_blobs_meta(prefix: str) -> List[Tuple[str, int, datetime]]:
+    """Devolve [(nome, tamanho, last_modified UTC)] dos blobs com o prefixo."""
+    return [
+        (b.name, b.size, b.last_modified)
+        for b in container_client.list_blobs(name_starts_with=prefix)
+    ]
+
+def delete_blobs(paths: List[str], chunk: int = 256) -> int:
+    """
+    Apaga blobs em lotes (limite do batch do Azure: 256). Uma falha num blob
+    não interrompe o lote: é registada e o blob fica para a próxima vez.
+    Devolve o nº apagado (404 = já não existia, conta como apagado).
+    """
+    n = 0
+    for i in range(0, len(paths), chunk):
+        part = paths[i:i + chunk]
+        responses = container_client.delete_blobs(*part, raise_on_any_failure=False)
+        for path, resp in zip(part, responses):
+            if resp.status_code in (202, 404):
+                n += 1
+            else:
+                print(f"[BLOB] ⚠️ não foi possível apagar {path}: HTTP {resp.status_code} {getattr(resp, 'reason', '')}")
+    return n
+
 # -------------------------------------------------------------------------
 # SAS helpers
 # -------------------------------------------------------------------------
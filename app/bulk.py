@@ -0,0 +1,266 @@
+# app/bulk.py
+# -------------------------------------------------------------------------
+# Modo bulk (offline) para varrimentos noturnos / de baixa prioridade
+#
+# Em vez de um chat.completions.create síncrono por lote de ROIs, compila
+# TODOS os pedidos em ficheiros JSONL da Batch API, submete-os e espera pelo
+# resultado (janela de 24h, quota separada do tempo real). No fim mapeia as
+# respostas para as ROIs e grava o output habitual (compute_final_scores →
+# data/input → concat). ROIs sem resposta válida no batch (pedido falhado,
+# detecção em falta) são pedidas pelo caminho síncrono antes de gravar.
+#
+# O estado do job fica em BULK_DIR/{job_id}/job.json, por isso um job pode
+# ser retomado depois de o processo morrer:
+#   python -m app.bulk run               # compila, submete, espera e recolhe
+#   python -m app.bulk submit            # só compila e submete
+#   python -m app.bulk resume <job_id>   # espera e recolhe um job existente
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import argparse, json, os, time
+from typing import Dict, List, Optional
+
+from .env import (
+    AZURE_OPENAI_DEPLOYMENT, OAI_ROI_BATCH, WIRE_FORMAT,
+    BULK_DEPLOYMENT, BULK_SAS_TTL_MINUTES, BULK_POLL_SECONDS, BULK_MAX_LINES, BULK_DIR,
+)
+from .blob_io import list_all_images, make_sas_url
+from .prompt import SYSTEM_PROMPT_ROI, build_user_content_for_rois
+from .vision_client import _client, request_body
+from .response_parser import parse_detections, match_detections
+from .concat_json import concat_json_files
+from .metrics import stage, incr
+from .frame_gate import FrameSkipped
+from . import main as agent
+
+TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+# -------------------------------------------------------------------------
+# Estado do job
+# -------------------------------------------------------------------------
+def _job_dir(job_id: str) -> str:
+    return os.path.join(BULK_DIR, job_id)
+
+def load_job(job_id: str) -> Dict:
+    with open(os.path.join(_job_dir(job_id), "job.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_job(job: Dict):
+    # "_triage" (features + miniatura por ROI) só vive em memória: um job
+    # retomado noutro processo não atualiza a triagem dessas ROIs
+    images = {
+        name: dict(img, rois=[{k: v for k, v in r.items() if k != "_triage"} for r in img["rois"]])
+        for name, img in job["images"].items()
+    }
+    path = os.path.join(_job_dir(job["id"]), "job.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(job, images=images), f)
+    os.replace(tmp, path)
+
+
+# -------------------------------------------------------------------------
+# 1. Compilar: snip + upload dos crops e escrita dos JSONL
+# -------------------------------------------------------------------------
+def compile_job(image_names: Optional[List[str]] = None, job_id: Optional[str] = None) -> Dict:
+    job_id = job_id or time.strftime("bulk-%Y%m%d-%H%M%S")
+    os.makedirs(_job_dir(job_id), exist_ok=True)
+    camera_json = agent.load_roi_json()
+    if image_names is None:
+        image_names = list_all_images()
+    deployment = BULK_DEPLOYMENT or AZURE_OPENAI_DEPLOYMENT
+
+    job = {"id": job_id, "created": time.time(), "images": {}, "requests": {}, "files": [], "collected": False}
+    lines: List[str] = []
+
+    def flush():
+        if not lines:
+            return
+        path = os.path.join(_job_dir(job_id), f"requests-{len(job['files']):03d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        job["files"].append({"path": path, "lines": len(lines), "file_id": None, "batch_id": None,
+                             "status": None, "output_file_id": None, "error_file_id": None})
+        lines.clear()
+
+    for i, blob_name in enumerate(image_names, start=1):
+        print(f"\n[BULK] ({i}/{len(image_names)}) → {blob_name}")
+        try:
+            _, rois, crop_paths, local_dets = agent.run_snip_only(blob_name, camera_json)
+        except FrameSkipped as e:
+            print(f"[GATE] {e}")
+            incr(f"frames_{e.reason}")
+            continue
+        except Exception as e:
+            print(f"[BULK] ERRO na imagem {blob_name}: {e}")
+            incr("image_errors")
+            continue
+        job["images"][blob_name] = {"rois": rois, "local": local_dets,
+                                    "crops": {r["roi_id"]: p for r, p in zip(rois, crop_paths)}}
+
+        # SAS longos: o batch pode demorar horas a começar
+        with stage("sas"):
+            sas_urls = [make_sas_url(p, minutes=BULK_SAS_TTL_MINUTES) for p in crop_paths]
+        pending = list(zip(rois, sas_urls))
+        for bi in range(0, len(pending), OAI_ROI_BATCH):
+            batch = pending[bi:bi + OAI_ROI_BATCH]
+            rois_batch = [r for r, _ in batch]
+            custom_id = f"{i:05d}-{rois_batch[0]['camera_id']}-{bi // OAI_ROI_BATCH:03d}"
+            user_content = build_user_content_for_rois(rois_meta=rois_batch, sas_urls=[s for _, s in batch])
+            body = request_body(SYSTEM_PROMPT_ROI, user_content, use_json_mode=True)
+            body["model"] = deployment
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST",
+                                     "url": "/chat/completions", "body": body}) + "\n")
+            job["requests"][custom_id] = {"image": blob_name, "roi_ids": [r["roi_id"] for r in rois_batch]}
+            if len(lines) >= BULK_MAX_LINES:
+                flush()
+    flush()
+
+    save_job(job)
+    print(f"[BULK] job {job_id}: {len(job['images'])} imagens, {len(job['requests'])} pedidos "
+          f"em {len(job['files'])} ficheiros JSONL")
+    return job
+
+
+# -------------------------------------------------------------------------
+# 2. Submeter e esperar
+# -------------------------------------------------------------------------
+def submit_job(job: Dict) -> Dict:
+    oai = _client()
+    for f in job["files"]:
+        if f["batch_id"]:
+            continue                      # já submetido (retoma)
+        with stage("bulk_submit"):
+            if not f["file_id"]:
+                with open(f["path"], "rb") as fh:
+                    f["file_id"] = oai.files.create(file=fh, purpose="batch").id
+                save_job(job)
+            b = oai.batches.create(input_file_id=f["file_id"], endpoint="/chat/completions",
+                                   completion_window="24h")
+        f["batch_id"], f["status"] = b.id, b.status
+        # um batch pode já vir terminado na resposta ao create
+        f["output_file_id"], f["error_file_id"] = b.output_file_id, b.error_file_id
+        save_job(job)
+        print(f"[BULK] {os.path.basename(f['path'])} ({f['lines']} pedidos) → {b.id}")
+    return job
+
+def wait_job(job: Dict, poll_seconds: float = BULK_POLL_SECONDS) -> Dict:
+    oai = _client()
+    with stage("bulk_wait"):
+        while True:
+            open_files = [f for f in job["files"] if f["batch_id"] and f["status"] not in TERMINAL]
+            for f in open_files:
+                b = oai.batches.retrieve(f["batch_id"])
+                if b.status != f["status"]:
+                    counts = b.request_counts
+                    done = f" ({counts.completed}/{counts.total})" if counts else ""
+                    print(f"[BULK] {f['batch_id']}: {f['status']} → {b.status}{done}")
+                f["status"] = b.status
+                f["output_file_id"] = b.output_file_id
+                f["error_file_id"] = b.error_file_id
+            save_job(job)
+            if all(f["status"] in TERMINAL for f in job["files"]):
+                return job
+            time.sleep(poll_seconds)
+
+
+# -------------------------------------------------------------------------
+# 3. Recolher: respostas → detecções → ficheiros habituais
+# -------------------------------------------------------------------------
+def _read_lines(oai, file_id: Optional[str]) -> List[Dict]:
+    if not file_id:
+        return []
+    rows = []
+    for line in oai.files.content(file_id).text.splitlines():
+        if line.strip():
+            rows.append(json.loads(line))
+    return rows
+
+def collect_job(job: Dict) -> Dict:
+    oai = _client()
+    matched: Dict[str, Dict[str, Dict]] = {name: {} for name in job["images"]}
+    failed = 0
+
+    with stage("bulk_collect"):
+        for f in job["files"]:
+            # batches expirados/cancelados podem ter saída parcial
+            for row in _read_lines(oai, f["output_file_id"]) + _read_lines(oai, f["error_file_id"]):
+                req = job["requests"].get(row.get("custom_id"))
+                resp = row.get("response") or {}
+                if req is None or resp.get("status_code") != 200:
+                    failed += 1
+                    continue
+                choices = (resp.get("body") or {}).get("choices") or [{}]
+                raw = (choices[0].get("message") or {}).get("content") or ""
+                rois = [r for r in job["images"][req["image"]]["rois"] if r["roi_id"] in req["roi_ids"]]
+                with stage("parse"):
+                    dets, _info = parse_detections(raw)
+                    matched[req["image"]].update(match_detections(dets, rois))
+
+    missing = retried = 0
+    for blob_name, img in job["images"].items():
+        got = matched[blob_name]
+        crops = img.get("crops") or {}
+        left = [r for r in img["rois"] if r["roi_id"] not in got and r["roi_id"] in crops]
+        if left:
+            # sobras do batch: pedido síncrono só dessas ROIs
+            print(f"[BULK] {blob_name}: {len(left)} ROIs sem resposta no batch → pedido síncrono")
+            retried += len(left)
+            try:
+                sync, _n, _err = agent.classify_rois(blob_name, left, [crops[r["roi_id"]] for r in left])
+                got.update(sync)
+            except Exception as e:
+                print(f"[BULK] ⚠️ pedido síncrono falhou para {blob_name}: {e}")
+        missing += sum(1 for r in img["rois"] if r["roi_id"] not in got)
+        if not got and not img["local"]:
+            print(f"[BULK] ⚠️ {blob_name}: sem detecções válidas, nada gravado")
+            incr("image_errors")
+            continue
+        out, n = agent.finish_image(blob_name, img["rois"], got, img["local"])
+        agent.commit_frame(blob_name)
+        incr("images")
+        print(f"[BULK] {blob_name} ✓ {n} detections → {out}")
+
+    if failed or retried:
+        print(f"[BULK] ⚠️ {failed} pedidos falhados no batch; {retried} ROIs pedidas de forma síncrona, "
+              f"{missing} continuam sem resposta")
+    job["collected"] = True
+    save_job(job)
+    concat_json_files(fmt=WIRE_FORMAT)
+    return job
+
+
+def run(image_names: Optional[List[str]] = None, poll_seconds: float = BULK_POLL_SECONDS) -> Dict:
+    job = submit_job(compile_job(image_names))
+    return collect_job(wait_job(job, poll_seconds))
+
+def resume(job_id: str, poll_seconds: float = BULK_POLL_SECONDS) -> Dict:
+    job = load_job(job_id)
+    if job["collected"]:
+        print(f"[BULK] job {job_id} já recolhido.")
+        return job
+    return collect_job(wait_job(submit_job(job), poll_seconds))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("run", help="compila, submete, espera e recolhe")
+    sub.add_parser("submit", help="compila e submete; recolher depois com resume")
+    r = sub.add_parser("resume", help="retoma um job (submete o que faltar, espera e recolhe)")
+    r.add_argument("job_id")
+    ap.add_argument("--poll", type=float, default=BULK_POLL_SECONDS, help="s entre consultas ao estado")
+    args = ap.parse_args()
+
+    if args.cmd == "run":
+        run(poll_seconds=args.poll)
+    elif args.cmd == "submit":
+        job = submit_job(compile_job())
+        print(f"[BULK] submetido: python -m app.bulk resume {job['id']}")
+    else:
+        resume(args.job_id, poll_seconds=args.poll)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,35 @@
 import os
-import json
 from pathlib import Path
 from datetime import datetime
 
+from shared.wire import read_file, write_file, ext_for
+
 INPUT_DIR = Path("data/input")
 OUTPUT_DIR = Path("data/outputs")
 
 
-def concat_json_files():
+def concat_json_files(fmt: str = "json"):
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    output_file = OUTPUT_DIR / f"roi_response_{timestamp}.json"
+    output_file = OUTPUT_DIR / f"roi_response_{timestamp}{ext_for(fmt)}"
 
     all_detections = []
+    unread = set()     # ficheiros que não se conseguiram ler: ficam para a próxima vez
     seen_keys = set()  # para evitar duplicados (camera_id, roi_id, image_name)
 
-    json_files = sorted(INPUT_DIR.glob("*.json"))
+    # aceita JSON e msgpack (ver shared/wire.py)
+    input_files = sorted(list(INPUT_DIR.glob("*.json")) + list(INPUT_DIR.glob("*.msgpack")))
 
-    if not json_files:
-        print(":x: Nenhum ficheiro JSON encontrado em data/input/")
+    if not input_files:
+        print(":x: Nenhum ficheiro JSON/msgpack encontrado em data/input/")
         return
 
-    print(f":arrow_right: Encontrados {len(json_files)} ficheiros JSON.")
+    print(f":arrow_right: Encontrados {len(input_files)} ficheiros de detections (JSON/msgpack).")
 
-    for fpath in json_files:
+    for fpath in input_files:
         try:
-            with open(fpath, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = read_file(fpath)
 
             dets = data.get("detections")
             if not isinstance(dets, list):
@@ -47,11 +49,11 @@ def concat_json_files():
                 all_detections.append(d)
 
         except Exception as e:
-            print(f":x: Erro ao ler {fpath.name}: {e}")
+            print(f":x: Erro ao ler {fpath.name}: {e} (fica no input)")
+            unread.add(fpath)
 
-    # guardar num único ficheiro JSON
-    with open(output_file, "w", encoding="utf-8") as out:
-        json.dump({"detections": all_detections}, out, ensure_ascii=False, indent=2)
+    # guardar num único ficheiro (formato pedido)
+    write_file(output_file, {"detections": all_detections}, fmt)
 
     print(":white_tick: Concatenação concluída!")
     print(f":package: Total de detections (deduplicadas): {len(all_detections)}")
@@ -59,12 +61,17 @@ def concat_json_files():
 
     # --- LIMPAR INPUT APÓS GUARDAR OUTPUT ---
     print(":broom: A limpar ficheiros do input...")
-    for fpath in json_files:
+    for fpath in input_files:
+        if fpath in unread:
+            continue
         try:
             fpath.unlink()
             print(f"   - Removido: {fpath.name}")
         except Exception as e:
             print(f":x: Erro ao remover {fpath.name}: {e}")
 
-    print(":sparkles: Cleanup concluído! Input está agora vazio.")
+    if unread:
+        print(f":warning: Cleanup concluído; {len(unread)} ficheiros ilegíveis ficaram no input.")
+    else:
+        print(":sparkles: Cleanup concluído! Input está agora vazio.")
 
@@ -0,0 +1,161 @@
+# app/crop_store.py
+# -------------------------------------------------------------------------
+# Arquivo de crops endereçado por conteúdo
+#
+#   {CROPS_PREFIX}/sha/{h[:2]}/{h}.jpg    → crop (h = sha256 dos bytes), 1x só
+#   {CROPS_PREFIX}/runs/{camera}_{ts}-{img}.json → manifest da execução
+#                                   ({roi_id: caminho do crop}; img = hash
+#                                   do nome da imagem, p/ lojas diferentes)
+#
+# Crops iguais entre ciclos (ROI sem alterações) não ficam duplicados: o
+# upload é um PUT condicional (If-None-Match: *) que o Blob recusa se o crop
+# já existir. Não há cache local de hashes: o gc corre noutro processo e um
+# crop apagado por ele tem de voltar a ser enviado.
+#
+# Compactação (cron / à mão):
+#   python -m app.crop_store gc [--keep-days 7] [--grace-hours 6] [--dry-run]
+# apaga manifests antigos (mantém sempre o último por imagem), crops que já
+# nenhum manifest referencia e as pastas antigas {camera}_{ts}/.
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import argparse, hashlib, json, os, re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from .env import CROPS_PREFIX, CROP_RETENTION_DAYS, CROP_GC_GRACE_HOURS
+from . import blob_io
+from .metrics import incr
+
+SHA_PREFIX = f"{CROPS_PREFIX}/sha/"
+RUNS_PREFIX = f"{CROPS_PREFIX}/runs/"
+
+
+def crop_path(data: bytes, ext: str) -> str:
+    h = hashlib.sha256(data).hexdigest()
+    return f"{SHA_PREFIX}{h[:2]}/{h}{ext}"
+
+def store_crops(items: List[Tuple[str, bytes, str]]) -> Tuple[List[str], int]:
+    """
+    items = [(ext, bytes, content_type), ...] pela ordem das ROIs.
+    Devolve (caminhos, nº de crops efetivamente enviados).
+    """
+    paths, todo = [], {}
+    for ext, data, ct in items:
+        path = crop_path(data, ext)
+        paths.append(path)
+        if path not in todo:
+            todo[path] = (data, ct)
+
+    created = blob_io.upload_if_absent([(p, data, ct) for p, (data, ct) in todo.items()])
+
+    incr("crops_uploaded", len(created))
+    incr("crops_deduped", len(paths) - len(created))
+    incr("crop_upload_bytes", sum(len(todo[p][0]) for p in created))
+    return paths, len(created)
+
+def write_manifest(camera_id: str, image_name: str, crops: Dict[str, str], ts: Optional[str] = None) -> str:
+    ts = ts or datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%SZ")
+    img = hashlib.sha1(image_name.encode("utf-8")).hexdigest()[:8]
+    path = f"{RUNS_PREFIX}{camera_id}_{ts}-{img}.json"
+    body = {"camera_id": camera_id, "image_name": image_name, "created": ts, "crops": crops}
+    blob_io.upload_bytes_many([(path, json.dumps(body).encode("utf-8"), "application/json")])
+    return path
+
+
+# -------------------------------------------------------------------------
+# Compactação
+# -------------------------------------------------------------------------
+_LEGACY_RE = re.compile(r"^(?P<cam>[^/]+)_\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}Z/")
+
+def _manifest_source(name: str) -> str:
+    """'runs/6371_2025-..Z-1a2b3c4d.json' → '6371-1a2b3c4d' (câmara + imagem)"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    cam, rest = stem.rsplit("_", 1) if "_" in stem else (stem, "")
+    return f"{cam}-{rest.rsplit('-', 1)[-1]}"
+
+def _referenced_by(manifests: List[str]) -> Optional[Set[str]]:
+    """Crops referenciados pelos manifests; None se algum não se conseguir ler."""
+    referenced: Set[str] = set()
+    for name in manifests:
+        try:
+            referenced.update(json.loads(blob_io.read_blob_bytes(name))["crops"].values())
+        except Exception as e:
+            # na dúvida não se apaga nada: um manifest ilegível pode referenciar qualquer crop
+            print(f"[CROPS] ⚠️ manifest {name} ilegível ({e}); compactação dos crops cancelada")
+            return None
+    return referenced
+
+def gc(keep_days: float = CROP_RETENTION_DAYS, grace_hours: float = CROP_GC_GRACE_HOURS,
+       dry_run: bool = False, now: Optional[datetime] = None) -> Dict[str, int]:
+    now = now or datetime.now(timezone.utc)
+    keep_since = now - timedelta(days=keep_days)
+    grace_since = now - timedelta(hours=grace_hours)
+    stats = {"manifests_kept": 0, "manifests_deleted": 0, "crops_kept": 0,
+             "crops_deleted": 0, "legacy_deleted": 0, "bytes_freed": 0}
+
+    # uma só listagem do prefixo inteiro
+    listing = blob_io.list_blobs_meta(CROPS_PREFIX + "/")
+
+    # 1. manifests: apaga os antigos, mas nunca o último de cada câmara/imagem
+    manifests = sorted((m for m in listing if m[0].startswith(RUNS_PREFIX)), key=lambda m: m[2])
+    latest = {_manifest_source(name): name for name, _size, _lm in manifests}
+    keep, drop = [], []
+    for name, size, lm in manifests:
+        (keep if lm >= keep_since or latest[_manifest_source(name)] == name else drop).append(name)
+
+    # 2. crops referenciados pelos manifests que ficam
+    referenced = _referenced_by(keep)
+
+    # 3. crops órfãos (com margem para execuções a meio: crop enviado, manifest ainda não)
+    crops_drop: Dict[str, int] = {}
+    if referenced is not None:
+        for name, size, lm in listing:
+            if name.startswith(SHA_PREFIX) and name not in referenced and lm < grace_since:
+                crops_drop[name] = size
+
+    # 3b. re-listagem dos manifests mesmo antes de apagar: um agente pode ter
+    # escrito entretanto um manifest que reutiliza um crop antigo (deduplicado)
+    if crops_drop and not dry_run:
+        seen = {name for name, _size, _lm in manifests}
+        late = _referenced_by([name for name, _size, _lm in blob_io.list_blobs_meta(RUNS_PREFIX)
+                               if name not in seen])
+        if late is None:
+            crops_drop = {}
+        else:
+            crops_drop = {name: size for name, size in crops_drop.items() if name not in late}
+    stats["crops_kept"] = sum(1 for name, _size, _lm in listing if name.startswith(SHA_PREFIX)) - len(crops_drop)
+    stats["bytes_freed"] += sum(crops_drop.values())
+
+    # 4. layout antigo: {CROPS_PREFIX}/{camera}_{ts}/roi_*.jpg
+    legacy_drop = []
+    for name, size, lm in listing:
+        if _LEGACY_RE.match(name[len(CROPS_PREFIX) + 1:]) and lm < keep_since:
+            legacy_drop.append(name)
+            stats["bytes_freed"] += size
+
+    stats["manifests_kept"] = len(keep)
+    stats["manifests_deleted"] = len(drop)
+    stats["crops_deleted"] = len(crops_drop)
+    stats["legacy_deleted"] = len(legacy_drop)
+    if not dry_run:
+        blob_io.delete_blobs(drop + list(crops_drop) + legacy_drop)
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("gc", help="apaga manifests antigos e crops sem referências")
+    g.add_argument("--keep-days", type=float, default=CROP_RETENTION_DAYS)
+    g.add_argument("--grace-hours", type=float, default=CROP_GC_GRACE_HOURS)
+    g.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    stats = gc(args.keep_days, args.grace_hours, dry_run=args.dry_run)
+    tag = " (dry-run)" if args.dry_run else ""
+    print(f"[CROPS] compactação{tag}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# app/emitter.py
+# -------------------------------------------------------------------------
+# Emissão antecipada de detecções para o backend (POST /ingest, partial=true)
+#
+# Cada detecção terminada no stream do modelo é posta numa fila; uma thread
+# envia tudo o que estiver acumulado num só POST. Um POST que falha é
+# repetido com backoff (retries vezes); se continuar a falhar, as detecções
+# só chegam com o frame completo, que o pipeline de ficheiros
+# (data/input → concat → file_poller) continua a enviar.
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import queue, threading, time
+from typing import Dict, List, Optional
+
+import requests
+
+from shared.wire import encode, mime_for
+from .metrics import observe, incr
+
+
+class BackendEmitter:
+    def __init__(self, url: str, fmt: str = "json", timeout: float = 10.0, max_batch: int = 200,
+                 retries: int = 3, backoff: float = 0.5):
+        self.url = url
+        self.fmt = fmt
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.retries = retries
+        self.backoff = backoff
+        self._q: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def emit(self, detection: Dict, t_start: Optional[float] = None):
+        """t_start: instante (perf_counter) do início do pedido ao modelo, para medir latência."""
+        self._q.put((detection, t_start))
+
+    def _drain(self, first) -> List[tuple]:
+        items = [first]
+        while len(items) < self.max_batch:
+            try:
+                nxt = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                self._q.put(None)       # re-coloca o sinal de paragem
+                break
+            items.append(nxt)
+        return items
+
+    def _run(self):
+        while True:
+            first = self._q.get()
+            if first is None:
+                return
+            items = self._drain(first)
+            if not self._send(items):
+                incr("emit_dropped", len(items))
+                print(f"[EMIT] ⚠️ {len(items)} detecções não enviadas; seguem com o frame completo (data/input)")
+
+    def _send(self, items: List[tuple]) -> bool:
+        data = encode({"partial": True, "detections": [d for d, _ in items]}, self.fmt)
+        for attempt in range(self.retries + 1):
+            try:
+                r = self._session.post(
+                    self.url, data=data,
+                    headers={"Content-Type": mime_for(self.fmt)}, timeout=self.timeout,
+                )
+                r.raise_for_status()
+            except Exception as e:
+                print(f"[EMIT] ⚠️ falha a enviar {len(items)} detecções (tentativa {attempt + 1}): {e}")
+                if attempt < self.retries:
+                    time.sleep(self.backoff * (2 ** attempt))
+                continue
+            now = time.perf_counter()
+            for _d, t0 in items:
+                if t0 is not None:
+                    observe("emit_latency", now - t0)
+            return True
+        return False
+
+    def close(self):
+        """Envia o que falta e termina a thread."""
+        self._q.put(None)
+        self._thread.join()
+        self._session.close()
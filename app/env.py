@@ -43,9 +43,19 @@ AZURE_STORAGE_ACCOUNT_KEY       = _get("AZURE_STORAGE_KEY", "")
 UPLOAD_MAX_CONCURRENCY = _get("UPLOAD_MAX_CONCURRENCY", 8, cast=int)
 SAS_TTL_MINUTES        = _get("SAS_TTL_MINUTES", 30, cast=int)
 
+# formato dos ficheiros de detections em data/ e do POST /ingest: json | msgpack
+WIRE_FORMAT            = _get("WIRE_FORMAT", "json")
+
+# decode reduzido (opt-in): lado maior mínimo (px) dos crops; 0 = resolução original
+CROP_MIN_SIDE          = _get("CROP_MIN_SIDE", 0, cast=int)
+
 # prefixo dos crops (pasta no container)
 CROPS_PREFIX = _get("CROPS_PREFIX", "crops")
 
+# compactação do arquivo de crops (python -m app.crop_store gc)
+CROP_RETENTION_DAYS = _get("CROP_RETENTION_DAYS", 7, cast=float)    # idade máxima dos manifests
+CROP_GC_GRACE_HOURS = _get("CROP_GC_GRACE_HOURS", 6, cast=float)    # crops órfãos mais novos ficam
+
 # JSON de ROIs (opcional: blob path)
 ROI_JSON_BLOB = _get("ROI_JSON_BLOB", "")
 
@@ -56,3 +66,53 @@ ROI_JSON_BLOB = _get("ROI_JSON_BLOB", "")
 OAI_ROI_BATCH    = _get("OAI_ROI_BATCH", 4, cast=int)      # nº de ROIs por pedido
 OAI_MAX_RETRIES  = _get("OAI_MAX_RETRIES", 6, cast=int)    # nº de tentativas
 OAI_BACKOFF_BASE = _get("OAI_BACKOFF_BASE", 1.8, cast=float)  # fator de backoff exponencial
+ROI_MAX_REQUEUE  = _get("ROI_MAX_REQUEUE", 2, cast=int)    # re-pedidos só das ROIs em falta
+
+# streaming: cada detecção terminada segue logo para o backend (partial=true)
+STREAM_DETECTIONS  = _get("STREAM_DETECTIONS", 0, cast=int)
+BACKEND_INGEST_URL = _get("BACKEND_INGEST_URL", "http://backend:8000/ingest")
+
+
+# -------------------------------------------------------------------------
+# 🔷 Fila de trabalho partilhada (várias réplicas do agente)
+# -------------------------------------------------------------------------
+WORK_QUEUE_URL       = _get("WORK_QUEUE_URL", "")                    # vazio = sem fila (processa tudo)
+WORK_LEASE_SECONDS   = _get("WORK_LEASE_SECONDS", 300, cast=float)   # visibility timeout
+WORK_MAX_ATTEMPTS    = _get("WORK_MAX_ATTEMPTS", 3, cast=int)
+AGENT_CYCLE_SECONDS  = _get("AGENT_CYCLE_SECONDS", 600, cast=int)    # 1 job por imagem por ciclo
+WORK_POLL_SECONDS    = _get("WORK_POLL_SECONDS", 15, cast=float)    # espera com a fila vazia
+
+
+# -------------------------------------------------------------------------
+# 🔷 Triagem local das ROIs (antes do modelo) — ver app/triage.py
+# -------------------------------------------------------------------------
+TRIAGE_ENABLED            = _get("TRIAGE_ENABLED", 0, cast=int)
+TRIAGE_EMPTY_THRESHOLD    = _get("TRIAGE_EMPTY_THRESHOLD", 0.9, cast=float)   # P(vazio) mínima
+TRIAGE_UNCHANGED_MAX_DIFF = _get("TRIAGE_UNCHANGED_MAX_DIFF", 6.0, cast=float) # dif. média 0–255 (16x16)
+TRIAGE_FULL_MIN_PCT       = _get("TRIAGE_FULL_MIN_PCT", 90, cast=int)
+TRIAGE_AUDIT_RATE         = _get("TRIAGE_AUDIT_RATE", 0.1, cast=float)         # amostra enviada na mesma
+TRIAGE_MODEL_PATH         = _get("TRIAGE_MODEL_PATH", "data/triage_model.json")
+
+
+# -------------------------------------------------------------------------
+# 🔷 Filtro de qualidade do frame (antes das ROIs) — ver app/frame_gate.py
+# -------------------------------------------------------------------------
+FRAME_GATE_ENABLED       = _get("FRAME_GATE_ENABLED", 0, cast=int)
+FRAME_UNCHANGED_MAX_DIFF = _get("FRAME_UNCHANGED_MAX_DIFF", 1.5, cast=float)  # dif. média 0–255
+FRAME_MAX_AGE_SECONDS    = _get("FRAME_MAX_AGE_SECONDS", 3600, cast=float)    # reprocessa mesmo sem mudanças
+FRAME_BLUR_RATIO         = _get("FRAME_BLUR_RATIO", 0.5, cast=float)          # nitidez vs referência
+FRAME_OCCLUSION_DIFF     = _get("FRAME_OCCLUSION_DIFF", 25, cast=int)         # píxel "mudou" acima disto
+FRAME_OCCLUSION_FRAC     = _get("FRAME_OCCLUSION_FRAC", 0.5, cast=float)      # ROI tapada acima disto
+FRAME_BAD_ROI_FRAC       = _get("FRAME_BAD_ROI_FRAC", 0.3, cast=float)        # ROIs más para rejeitar
+FRAME_MAX_DEFERS         = _get("FRAME_MAX_DEFERS", 2, cast=int)              # depois disto aceita
+FRAME_RETRY_SECONDS      = _get("FRAME_RETRY_SECONDS", 60, cast=float)
+
+
+# -------------------------------------------------------------------------
+# 🔷 Modo bulk (offline): pedidos em ficheiros JSONL para a Batch API
+# -------------------------------------------------------------------------
+BULK_DEPLOYMENT       = _get("BULK_DEPLOYMENT", "")                      # vazio = AZURE_OPENAI_DEPLOYMENT
+BULK_SAS_TTL_MINUTES  = _get("BULK_SAS_TTL_MINUTES", 2880, cast=int)     # crops têm de viver até ao fim do job
+BULK_POLL_SECONDS     = _get("BULK_POLL_SECONDS", 60, cast=float)
+BULK_MAX_LINES        = _get("BULK_MAX_LINES", 50000, cast=int)          # pedidos por ficheiro JSONL
+BULK_DIR              = _get("BULK_DIR", "data/bulk")
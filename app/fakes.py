@@ -0,0 +1,436 @@
+# app/fakes.py
+# -------------------------------------------------------------------------
+# Stand-ins locais do Azure para benchmarks (sem cloud):
+#   FakeContainerClient → subconjunto do ContainerClient do Blob, em memória
+#   FakeVisionServer    → servidor HTTP compatível com Azure OpenAI
+#                         /chat/completions (latência, 429s e tamanho de
+#                         resposta configuráveis, com ou sem stream); aceita
+#                         também POST /ingest (sink do backend) e as rotas
+#                         /files e /batches da Batch API (modo bulk)
+#   synth_shelf_image   → imagem sintética de expositor a partir do planograma
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import datetime, email.parser, email.policy, hashlib, io, json, random, re, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from azure.core.exceptions import ResourceExistsError
+from PIL import Image, ImageDraw
+
+
+# -------------------------------------------------------------------------
+# Blob em memória
+# -------------------------------------------------------------------------
+class _Download:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def readall(self) -> bytes:
+        return self._data
+
+
+class FakeBlobClient:
+    def __init__(self, container: "FakeContainerClient", name: str):
+        self._c = container
+        self.blob_name = name
+
+    @property
+    def url(self) -> str:
+        return f"{self._c.url}/{self.blob_name}"
+
+    def download_blob(self):
+        self._c._wait()
+        with self._c._lock:
+            self._c.stats["downloads"] += 1
+            if self.blob_name not in self._c.blobs:
+                raise KeyError(f"blob não existe: {self.blob_name}")
+            data, _ct = self._c.blobs[self.blob_name]
+        return _Download(data)
+
+    def upload_blob(self, data: bytes, overwrite: bool = False, content_type: Optional[str] = None, **_kw):
+        self._c._wait()
+        with self._c._lock:
+            if not overwrite and self.blob_name in self._c.blobs:
+                self._c.stats["conflicts"] += 1
+                raise ResourceExistsError(f"blob já existe: {self.blob_name}")
+            self._c.blobs[self.blob_name] = (bytes(data), content_type or "application/octet-stream")
+            self._c.modified[self.blob_name] = datetime.datetime.now(datetime.timezone.utc)
+            self._c.stats["uploads"] += 1
+            self._c.stats["upload_bytes"] += len(data)
+
+    def delete_blob(self, **_kw):
+        self._c.delete_blob(self.blob_name)
+
+
+class FakeContainerClient:
+    """Container em memória com latência opcional por operação."""
+
+    def __init__(self, latency_s: float = 0.0, url: str = "http://127.0.0.1:10000/bench/hackathon"):
+        self.blobs: Dict[str, Tuple[bytes, str]] = {}
+        self.modified: Dict[str, datetime.datetime] = {}
+        self.latency_s = latency_s
+        self.url = url
+        self.stats = {"downloads": 0, "uploads": 0, "upload_bytes": 0, "lists": 0, "deletes": 0, "conflicts": 0}
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency_s > 0:
+            time.sleep(self.latency_s)
+
+    def get_blob_client(self, blob: str) -> FakeBlobClient:
+        return FakeBlobClient(self, blob)
+
+    def list_blobs(self, name_starts_with: Optional[str] = None, **_kw):
+        self._wait()
+        with self._lock:
+            self.stats["lists"] += 1
+            items = sorted(self.blobs.items())
+        for name, (data, ct) in items:
+            if name_starts_with and not name.startswith(name_starts_with):
+                continue
+            yield SimpleNamespace(name=name, size=len(data), last_modified=self.modified.get(name),
+                                  content_settings=SimpleNamespace(content_type=ct))
+
+    def delete_blob(self, blob: str, **_kw):
+        self._wait()
+        with self._lock:
+            self.blobs.pop(blob, None)
+            self.modified.pop(blob, None)
+            self.stats["deletes"] += 1
+
+    def delete_blobs(self, *blobs: str, **_kw):
+        """Como o batch do Azure com raise_on_any_failure=False: uma resposta por blob."""
+        self._wait()                      # 1 pedido por lote, como o batch do Azure
+        responses = []
+        with self._lock:
+            for blob in blobs:
+                found = self.blobs.pop(blob, None) is not None
+                self.modified.pop(blob, None)
+                responses.append(SimpleNamespace(status_code=202 if found else 404,
+                                                 reason="Accepted" if found else "Not Found"))
+            self.stats["deletes"] += len(blobs)
+        return iter(responses)
+
+
+# -------------------------------------------------------------------------
+# Imagens sintéticas
+# -------------------------------------------------------------------------
+def synth_shelf_image(products: List[Dict], size=(1280, 720), seed: int = 0, quality: int = 85) -> bytes:
+    """
+    Fundo neutro + cada ROI do planograma preenchida com "fruta" (círculos)
+    numa densidade aleatória (algumas ROIs ficam vazias).
+    """
+    rnd = random.Random(seed)
+    img = Image.new("RGB", size, (92, 88, 80))
+    draw = ImageDraw.Draw(img)
+    for p in products:
+        c = p.get("image_coordinates") or {}
+        try:
+            poly = [tuple(c[k]) for k in ("top_left", "top_right", "bottom_right", "bottom_left")]
+        except KeyError:
+            continue
+        draw.polygon(poly, fill=(60, 45, 35))          # caixa
+        fill = rnd.choice((0.0, 0.3, 0.7, 1.0))
+        xs = [x for x, _ in poly]; ys = [y for _, y in poly]
+        base = (rnd.randint(120, 250), rnd.randint(60, 220), rnd.randint(20, 90))
+        for _ in range(int(fill * 60)):
+            x = rnd.uniform(min(xs), max(xs)); y = rnd.uniform(min(ys), max(ys))
+            r = rnd.uniform(6, 14)
+            shade = tuple(max(0, min(255, v + rnd.randint(-25, 25))) for v in base)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=shade)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+# -------------------------------------------------------------------------
+# Azure OpenAI falso
+# -------------------------------------------------------------------------
+_ROI_RE = re.compile(r"roi_id=([^;]+);")
+
+
+def fake_detection(roi_id: str, pad_chars: int = 0) -> Dict:
+    """Detecção determinística (mesma roi_id → mesmos valores)."""
+    h = hashlib.sha1(roi_id.encode("utf-8")).digest()
+    q = (0, 25, 60, 95)[h[0] % 4]
+    return {
+        "roi_id": roi_id,
+        "fruit_type": "fruit",
+        "quantidade_pct": q,
+        "qualidade_pct": 0 if q == 0 else 60 + h[1] % 40,
+        "organizacao_pct": 0 if q == 0 else 40 + h[2] % 60,
+        "contexto_pct": 0 if q == 0 else 50 + h[3] % 50,
+        "insights": ("empty ROI / no product visible" if q == 0 else "synthetic") + " " * pad_chars,
+        "confidence": round(0.5 + (h[4] % 50) / 100, 2),
+    }
+
+
+class FakeVisionServer:
+    """
+    Servidor HTTP local que responde a POST .../chat/completions como o Azure
+    OpenAI. Extrai os roi_id do texto do pedido e devolve uma detecção por ROI.
+      latency_s / jitter_s → tempo de resposta
+      p429                 → probabilidade de responder 429 (com retry-after-ms)
+      pad_chars            → inflaciona 'insights' (respostas maiores)
+      batch_delay_s        → tempo até um batch passar a "completed"
+      batch_fail_rate      → fração de linhas de um batch que vão para o error file
+    """
+
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0, p429: float = 0.0,
+                 pad_chars: int = 0, seed: int = 0, host: str = "127.0.0.1", port: int = 0,
+                 batch_delay_s: float = 0.0, batch_fail_rate: float = 0.0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.p429 = p429
+        self.pad_chars = pad_chars
+        self.batch_delay_s = batch_delay_s
+        self.batch_fail_rate = batch_fail_rate
+        self.rnd = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0, "rois": 0, "response_bytes": 0, "ingested": 0,
+                      "files": 0, "batches": 0, "batch_lines": 0}
+        self.files: Dict[str, Dict] = {}
+        self.batches: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeVisionServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # --- lógica de resposta (sobreponível) ---
+    def _roll(self) -> Tuple[bool, float]:
+        with self._lock:
+            self.stats["requests"] += 1
+            throttle = self.rnd.random() < self.p429
+            delay = self.latency_s + self.rnd.uniform(0, self.jitter_s)
+            if throttle:
+                self.stats["throttled"] += 1
+        return throttle, delay
+
+    def completion_content(self, body: Dict) -> str:
+        texts = []
+        for m in body.get("messages", []):
+            c = m.get("content")
+            if isinstance(c, str):
+                texts.append(c)
+            elif isinstance(c, list):
+                texts.extend(p.get("text", "") for p in c if isinstance(p, dict))
+        roi_ids = _ROI_RE.findall("\n".join(texts))
+        with self._lock:
+            self.stats["rois"] += len(roi_ids)
+        return json.dumps({"detections": [fake_detection(r, self.pad_chars) for r in roi_ids]})
+
+    def completion_body(self, body: Dict) -> Dict:
+        content = self.completion_content(body)
+        return {
+            "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4,
+                      "total_tokens": len(content) // 4},
+        }
+
+    def stream_chunks(self, body: Dict, chunk_chars: int = 24):
+        content = self.completion_content(body)
+        base = {"id": f"chatcmpl-fake-{int(time.time() * 1000)}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "fake")}
+        for i in range(0, len(content), chunk_chars):
+            yield dict(base, choices=[{"index": 0, "delta": {"content": content[i:i + chunk_chars]},
+                                       "finish_reason": None}])
+        yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+
+    # --- Batch API (files + batches) ---
+    def create_file(self, data: bytes, filename: str, purpose: str) -> Dict:
+        fid = f"file-{uuid.uuid4().hex[:24]}"
+        meta = {"id": fid, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        with self._lock:
+            self.files[fid] = dict(meta, _data=data)
+            self.stats["files"] += 1
+        return meta
+
+    def create_batch(self, body: Dict) -> Optional[Dict]:
+        with self._lock:
+            if body.get("input_file_id") not in self.files:
+                return None
+            bid = f"batch_{uuid.uuid4().hex[:24]}"
+            self.batches[bid] = {
+                "id": bid, "object": "batch", "endpoint": body.get("endpoint"),
+                "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window"),
+                "status": "validating", "created_at": int(time.time()),
+                "output_file_id": None, "error_file_id": None, "errors": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                "_due": time.time() + self.batch_delay_s,
+            }
+            self.stats["batches"] += 1
+        return self.batch_view(bid)
+
+    def _run_batch(self, batch: Dict):
+        """Processa todas as linhas de uma vez e gera os ficheiros de saída/erro."""
+        out, err = [], []
+        with self._lock:
+            data = self.files[batch["input_file_id"]]["_data"]
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            rid = f"req-{uuid.uuid4().hex[:12]}"
+            with self._lock:
+                fail = self.rnd.random() < self.batch_fail_rate
+            if fail:
+                err.append({"id": rid, "custom_id": req["custom_id"], "response": None,
+                            "error": {"code": "server_error", "message": "falha simulada"}})
+                continue
+            out.append({"id": rid, "custom_id": req["custom_id"], "error": None,
+                        "response": {"status_code": 200, "request_id": rid,
+                                     "body": self.completion_body(req["body"])}})
+        with self._lock:
+            self.stats["batch_lines"] += len(out) + len(err)
+            for key, rows in (("output_file_id", out), ("error_file_id", err)):
+                if rows:
+                    blob = "".join(json.dumps(r) + "\n" for r in rows).encode("utf-8")
+                    fid = f"file-{uuid.uuid4().hex[:24]}"
+                    self.files[fid] = {"id": fid, "object": "file", "bytes": len(blob),
+                                       "created_at": int(time.time()), "filename": f"{batch['id']}_{key}.jsonl",
+                                       "purpose": "batch_output", "status": "processed", "_data": blob}
+                    batch[key] = fid
+            batch["request_counts"] = {"total": len(out) + len(err), "completed": len(out), "failed": len(err)}
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+
+    def batch_view(self, bid: str) -> Optional[Dict]:
+        with self._lock:
+            batch = self.batches.get(bid)
+            if batch is None:
+                return None
+            run = False
+            if batch["status"] in ("validating", "in_progress"):
+                if time.time() >= batch["_due"]:
+                    batch["status"] = "finalizing"
+                    run = True
+                else:
+                    batch["status"] = "in_progress"
+        if run:
+            self._run_batch(batch)
+        with self._lock:
+            return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code: int, payload: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                with server._lock:
+                    server.stats["response_bytes"] += len(data)
+
+            def _stream(self, body: Dict, delay: float):
+                # 1º token ao fim de 20% da latência; o resto espalhado pelos chunks
+                chunks = list(server.stream_chunks(body))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                time.sleep(delay * 0.2)
+                step = delay * 0.8 / max(1, len(chunks))
+                for c in chunks:
+                    data = f"data: {json.dumps(c)}\n\n".encode("utf-8")
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                    with server._lock:
+                        server.stats["response_bytes"] += len(data)
+                    time.sleep(step)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def _upload(self, raw: bytes):
+                # multipart/form-data do SDK: campos "purpose" e "file"
+                msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                    b"Content-Type: " + self.headers.get("Content-Type", "").encode() + b"\r\n\r\n" + raw
+                )
+                fields, data, filename = {}, b"", "upload.jsonl"
+                for part in msg.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    if name == "file":
+                        data = part.get_payload(decode=True) or b""
+                        filename = part.get_filename() or filename
+                    else:
+                        fields[name] = part.get_content().strip()
+                return self._send(200, server.create_file(data, filename, fields.get("purpose", "")))
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                m = re.search(r"/files/([^/]+)/content$", path)
+                if m:
+                    with server._lock:
+                        f = server.files.get(m.group(1))
+                    if f is None:
+                        return self._send(404, {"error": {"message": "ficheiro não existe"}})
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(len(f["_data"])))
+                    self.end_headers()
+                    self.wfile.write(f["_data"])
+                    return
+                m = re.search(r"/batches/([^/]+)$", path)
+                batch = server.batch_view(m.group(1)) if m else None
+                if batch is None:
+                    return self._send(404, {"error": {"message": f"rota desconhecida {self.path}"}})
+                self._send(200, batch)
+
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(n)
+                path = self.path.split("?")[0]
+                if path.endswith("/ingest"):
+                    with server._lock:
+                        server.stats["ingested"] += 1
+                    return self._send(200, {"status": "ok"})
+                if path.endswith("/files"):
+                    return self._upload(raw)
+                body = json.loads(raw or b"{}")
+                if path.endswith("/batches"):
+                    batch = server.create_batch(body)
+                    if batch is None:
+                        return self._send(400, {"error": {"message": "input_file_id inválido"}})
+                    return self._send(200, batch)
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": f"rota desconhecida {self.path}"}})
+                throttle, delay = server._roll()
+                if throttle:
+                    return self._send(429, {"error": {"code": "429", "message": "Rate limit (fake)"}},
+                                      {"retry-after-ms": "200"})
+                if body.get("stream"):
+                    return self._stream(body, delay)
+                time.sleep(delay)
+                self._send(200, server.completion_body(body))
+
+        return Handler
@@ -0,0 +1,197 @@
+# app/frame_gate.py
+# -------------------------------------------------------------------------
+# Filtro de qualidade do frame inteiro (antes do recorte das ROIs)
+#
+# Descodifica o frame a 1/4 (draft mode do JPEG, em tons de cinzento) e
+# compara-o com o último frame ACEITE E PROCESSADO da mesma câmara (check()
+# aceita; commit() grava a referência só depois de o resultado estar escrito):
+#   "unchanged" → bytes iguais ou diferença média mínima → salta (os
+#                 resultados anteriores continuam válidos)
+#   "blurred"   → nitidez (variância do Laplaciano) na região de muitas ROIs
+#                 muito abaixo da referência da câmara → tenta mais tarde
+#   "occluded"  → grande parte da região de muitas ROIs mudou de uma vez
+#                 (cliente, carrinho à frente do expositor) → tenta mais tarde
+# Ao fim de FRAME_MAX_DEFERS rejeições seguidas o frame é aceite na mesma
+# (uma mudança real e persistente no expositor não fica bloqueada), e um
+# frame "unchanged" é reprocessado se o último aceite tiver mais de
+# FRAME_MAX_AGE_SECONDS.
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import hashlib, io, json, math, os, time
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+GATE_WIDTH = 320
+
+# Laplaciano 3x3 (offset 128 para caber em "L")
+_LAPLACE = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+
+class FrameSkipped(Exception):
+    """Frame rejeitado pelo filtro; `retry` indica se vale a pena tentar mais tarde."""
+
+    def __init__(self, blob_name: str, reason: str, retry: bool, detail: str = ""):
+        super().__init__(f"{blob_name}: frame {reason}{f' ({detail})' if detail else ''}")
+        self.blob_name = blob_name
+        self.reason = reason
+        self.retry = retry
+
+
+# -------------------------------------------------------------------------
+# Imagem reduzida e métricas por região
+# -------------------------------------------------------------------------
+def gate_image(data: bytes) -> Tuple[Image.Image, float]:
+    """Frame em "L" com GATE_WIDTH de largura. Devolve (imagem, escala vs original)."""
+    img = Image.open(io.BytesIO(data))
+    full_w, full_h = img.size
+    if img.format == "JPEG":
+        img.draft("L", (GATE_WIDTH, math.ceil(GATE_WIDTH * full_h / full_w)))
+    img = img.convert("L")
+    if img.size[0] != GATE_WIDTH:
+        img = img.resize((GATE_WIDTH, max(1, round(GATE_WIDTH * full_h / full_w))), Image.BILINEAR)
+    return img, GATE_WIDTH / full_w
+
+def roi_box(quad: Dict, scale: float, size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    xs = [quad[k][0] * scale for k in ("top_left", "top_right", "bottom_right", "bottom_left")]
+    ys = [quad[k][1] * scale for k in ("top_left", "top_right", "bottom_right", "bottom_left")]
+    box = (max(0, math.floor(min(xs))), max(0, math.floor(min(ys))),
+           min(size[0], math.ceil(max(xs))), min(size[1], math.ceil(max(ys))))
+    if box[2] - box[0] < 4 or box[3] - box[1] < 4:
+        return None
+    return box
+
+def sharpness(region: Image.Image) -> float:
+    """Variância do Laplaciano (alta = nítido)."""
+    return ImageStat.Stat(region.filter(_LAPLACE)).var[0]
+
+def changed_frac(a: Image.Image, b: Image.Image, threshold: int) -> float:
+    """Fração de píxeis com |a-b| > threshold."""
+    diff = ImageChops.difference(a, b).point(lambda v: 255 if v > threshold else 0)
+    return ImageStat.Stat(diff).mean[0] / 255.0
+
+
+# -------------------------------------------------------------------------
+# Filtro
+# -------------------------------------------------------------------------
+class FrameGate:
+    """
+    Estado por imagem (blob) em `state_dir`: {key}.png com o último frame
+    aceite (reduzido) e {key}.json com hash, data, referência de nitidez por
+    ROI e nº de rejeições seguidas.
+    """
+
+    def __init__(self, unchanged_max_diff: float = 1.5, max_age_s: float = 3600,
+                 blur_ratio: float = 0.5, occlusion_diff: int = 25, occlusion_frac: float = 0.5,
+                 bad_roi_frac: float = 0.3, max_defers: int = 2, state_dir: str = "data/frame_gate"):
+        self.unchanged_max_diff = unchanged_max_diff
+        self.max_age_s = max_age_s
+        self.blur_ratio = blur_ratio
+        self.occlusion_diff = occlusion_diff
+        self.occlusion_frac = occlusion_frac
+        self.bad_roi_frac = bad_roi_frac
+        self.max_defers = max_defers
+        self.state_dir = state_dir
+        # frames aceites por check() à espera de commit() (blob → (meta, imagem))
+        self._pending: Dict[str, Tuple[Dict, Image.Image]] = {}
+
+    @staticmethod
+    def key(blob_name: str) -> str:
+        # lojas diferentes podem ter a mesma câmara: a chave é o blob
+        return blob_name.replace("/", "__")
+
+    def _paths(self, blob_name: str) -> Tuple[str, str]:
+        base = os.path.join(self.state_dir, self.key(blob_name))
+        return base + ".json", base + ".png"
+
+    def _load(self, blob_name: str) -> Tuple[Dict, Optional[Image.Image]]:
+        meta_path, img_path = self._paths(blob_name)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            prev = Image.open(img_path)
+            prev.load()
+            return meta, prev
+        except (OSError, ValueError):
+            return {}, None
+
+    def _save(self, blob_name: str, meta: Dict, img: Optional[Image.Image] = None):
+        os.makedirs(self.state_dir, exist_ok=True)
+        meta_path, img_path = self._paths(blob_name)
+        if img is not None:
+            img.save(img_path + ".tmp", format="PNG")
+            os.replace(img_path + ".tmp", img_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def check(self, blob_name: str, data: bytes, rois: List[Dict], now: Optional[float] = None) -> Dict:
+        """
+        Aceita o frame (devolve as métricas) ou levanta FrameSkipped.
+        O frame aceite só passa a ser a referência da câmara com commit().
+        """
+        now = time.time() if now is None else now
+        sha = hashlib.sha1(data).hexdigest()
+        meta, prev = self._load(blob_name)
+        fresh = now - meta.get("accepted_at", 0) < self.max_age_s
+
+        if meta.get("sha") == sha and fresh:
+            raise FrameSkipped(blob_name, "unchanged", retry=False, detail="bytes iguais")
+
+        img, scale = gate_image(data)
+        if prev is not None and prev.size != img.size:
+            prev = None                      # resolução da câmara mudou: recomeça
+        info = {"diff": None, "blurred": 0, "occluded": 0, "rois": 0}
+
+        if prev is not None:
+            info["diff"] = ImageStat.Stat(ImageChops.difference(img, prev)).mean[0]
+            if info["diff"] <= self.unchanged_max_diff and fresh:
+                raise FrameSkipped(blob_name, "unchanged", retry=False, detail=f"dif. {info['diff']:.2f}")
+
+        sharp, base = {}, meta.get("sharp", {})
+        for r in rois:
+            box = roi_box(r["quad"], scale, img.size)
+            if box is None:
+                continue
+            region = img.crop(box)
+            info["rois"] += 1
+            sharp[r["roi_id"]] = s = sharpness(region)
+            ref = base.get(r["roi_id"])
+            if ref and s < self.blur_ratio * ref:
+                info["blurred"] += 1
+            if prev is not None and changed_frac(region, prev.crop(box), self.occlusion_diff) >= self.occlusion_frac:
+                info["occluded"] += 1
+
+        reason = None
+        if info["rois"]:
+            if info["occluded"] / info["rois"] >= self.bad_roi_frac:
+                reason = "occluded"
+            elif info["blurred"] / info["rois"] >= self.bad_roi_frac:
+                reason = "blurred"
+
+        defers = int(meta.get("defers", 0))
+        if reason and defers < self.max_defers:
+            meta["defers"] = defers + 1
+            self._save(blob_name, meta)
+            raise FrameSkipped(blob_name, reason, retry=True,
+                               detail=f"{info[reason]}/{info['rois']} ROIs, rejeição {defers + 1}/{self.max_defers}")
+
+        # aceite: nova referência; nitidez de referência como média móvel
+        for rid, s in sharp.items():
+            sharp[rid] = s if rid not in base else 0.8 * base[rid] + 0.2 * s
+        self._pending[blob_name] = ({"sha": sha, "accepted_at": now, "sharp": sharp, "defers": 0}, img)
+        info["forced"] = bool(reason)
+        return info
+
+    def commit(self, blob_name: str) -> bool:
+        """
+        Grava o último frame aceite por check() como nova referência. Chamar
+        só depois de o frame ter sido processado e gravado: se falhar antes,
+        o próximo frame continua a ser comparado com a referência anterior.
+        """
+        pending = self._pending.pop(blob_name, None)
+        if pending is None:
+            return False
+        self._save(blob_name, *pending)
+        return True
@@ -11,23 +11,37 @@
 #                                                                              #
 # **************************************************************************** #
 
-import json, io, time, os, datetime
+import argparse, json, time, os, datetime
 from collections import Counter
-from PIL import Image
 
-from .env import CROPS_PREFIX, ROI_JSON_BLOB, OAI_ROI_BATCH
+from .env import (
+    ROI_JSON_BLOB, OAI_ROI_BATCH, CROP_MIN_SIDE, WIRE_FORMAT, ROI_MAX_REQUEUE,
+    WORK_QUEUE_URL, WORK_LEASE_SECONDS, WORK_MAX_ATTEMPTS, WORK_POLL_SECONDS, AGENT_CYCLE_SECONDS,
+    TRIAGE_ENABLED, TRIAGE_EMPTY_THRESHOLD, TRIAGE_UNCHANGED_MAX_DIFF, TRIAGE_FULL_MIN_PCT,
+    TRIAGE_AUDIT_RATE, TRIAGE_MODEL_PATH, STREAM_DETECTIONS, BACKEND_INGEST_URL,
+    FRAME_GATE_ENABLED, FRAME_UNCHANGED_MAX_DIFF, FRAME_MAX_AGE_SECONDS, FRAME_BLUR_RATIO,
+    FRAME_OCCLUSION_DIFF, FRAME_OCCLUSION_FRAC, FRAME_BAD_ROI_FRAC, FRAME_MAX_DEFERS,
+    FRAME_RETRY_SECONDS,
+)
 from .blob_io import (
     list_all_images,      # novo: lista todas as imagens no blob (fora de crops/)
     download_image,       # novo: download de uma imagem específica
     read_blob_bytes,
-    upload_bytes_many,
     make_sas_url,
 )
-from .snip import warp_quad_to_bytes
+from .snip import warp_quad, encode_crop, decode_for_rois, map_quad
 from .prompt import SYSTEM_PROMPT_ROI, build_user_content_for_rois
-from .vision_client import complete, parse_json
+from .vision_client import complete, complete_stream
+from .response_parser import parse_detections, match_detections, DetectionStreamParser
 from .weight import compute_final_scores
 from .concat_json import concat_json_files
+from .metrics import stage, incr
+from .triage import Triage, TriageModel
+from .emitter import BackendEmitter
+from .work_queue import open_queue, keep_alive, worker_id, current_cycle
+from .crop_store import store_crops, write_manifest
+from .frame_gate import FrameGate, FrameSkipped
+from shared.wire import write_file, ext_for
 
 
 # -------------------------------------------------------------------------
@@ -110,39 +124,163 @@ def extract_rois_flex(camera_json, image_name):
     return rois
 
 
+# -------------------------------------------------------------------------
+# Triagem local (opcional): ROIs óbvias não vão ao modelo
+# -------------------------------------------------------------------------
+_TRIAGE = None
+
+def get_triage():
+    global _TRIAGE
+    if TRIAGE_ENABLED and _TRIAGE is None:
+        _TRIAGE = Triage(
+            TriageModel.load(TRIAGE_MODEL_PATH),
+            empty_threshold=TRIAGE_EMPTY_THRESHOLD,
+            unchanged_max_diff=TRIAGE_UNCHANGED_MAX_DIFF,
+            full_min_pct=TRIAGE_FULL_MIN_PCT,
+            audit_rate=TRIAGE_AUDIT_RATE,
+        )
+    return _TRIAGE
+
+
+# -------------------------------------------------------------------------
+# Filtro de frames (opcional): tapados, desfocados ou repetidos não seguem
+# -------------------------------------------------------------------------
+_FRAME_GATE = None
+
+def get_frame_gate():
+    global _FRAME_GATE
+    if FRAME_GATE_ENABLED and _FRAME_GATE is None:
+        _FRAME_GATE = FrameGate(
+            unchanged_max_diff=FRAME_UNCHANGED_MAX_DIFF,
+            max_age_s=FRAME_MAX_AGE_SECONDS,
+            blur_ratio=FRAME_BLUR_RATIO,
+            occlusion_diff=FRAME_OCCLUSION_DIFF,
+            occlusion_frac=FRAME_OCCLUSION_FRAC,
+            bad_roi_frac=FRAME_BAD_ROI_FRAC,
+            max_defers=FRAME_MAX_DEFERS,
+        )
+    return _FRAME_GATE
+
+def commit_frame(blob_name: str):
+    """Frame processado e gravado → passa a ser a referência do filtro."""
+    gate = get_frame_gate()
+    if gate is not None:
+        gate.commit(blob_name)
+
+
+# -------------------------------------------------------------------------
+# Streaming (opcional): detecções seguem para o backend assim que fecham
+# -------------------------------------------------------------------------
+_EMITTER = None
+
+def get_emitter():
+    global _EMITTER
+    if STREAM_DETECTIONS and _EMITTER is None:
+        _EMITTER = BackendEmitter(BACKEND_INGEST_URL, fmt=WIRE_FORMAT)
+    return _EMITTER
+
+def close_emitter():
+    global _EMITTER
+    if _EMITTER is not None:
+        _EMITTER.close()
+        _EMITTER = None
+
+def _emit(emitter, det, t0=None):
+    # pontuação já calculada, igual à do ficheiro final
+    emitter.emit(compute_final_scores({"detections": [dict(det)]})["detections"][0], t0)
+
+def classify_batch_stream(rois_batch, user_content, emitter):
+    """
+    Pedido em streaming: cada detecção completa é validada, pontuada e
+    emitida logo. Devolve (matched, info, erro); o que já chegou antes de
+    um erro a meio do stream é mantido.
+    """
+    parser = DetectionStreamParser()
+    got, err = {}, None
+    t0 = time.perf_counter()
+    try:
+        for delta in complete_stream(SYSTEM_PROMPT_ROI, user_content, use_json_mode=True):
+            for d in parser.feed(delta):
+                left = [r for r in rois_batch if r["roi_id"] not in got]
+                for rid, det in match_detections([d], left).items():
+                    got[rid] = det
+                    if emitter is not None:
+                        _emit(emitter, det, t0)
+    except Exception as e:
+        err = e
+    info = {"truncated": parser.truncated, "errors": parser.errors, "salvaged": True}
+    return got, info, err
+
+
 # -------------------------------------------------------------------------
 # 1. Faz snip dos ROIs e sobe os crops (para UMA imagem)
+#    Devolve só as ROIs que precisam do modelo + detecções já decididas
+#    localmente pela triagem ({roi_id: detecção}).
 # -------------------------------------------------------------------------
 def run_snip_only(blob_name: str, camera_json):
     # download da imagem específica
-    bytes_img, mime = download_image(blob_name)
-    pil = Image.open(io.BytesIO(bytes_img)).convert("RGB")
+    with stage("download"):
+        bytes_img, mime = download_image(blob_name)
 
     # extrair ROIs só da câmara correspondente a esta imagem
     rois = extract_rois_flex(camera_json, blob_name)
     if not rois:
         raise RuntimeError(f"Sem ROIs válidas no JSON para a imagem {blob_name}.")
+
+    # frame tapado / desfocado / igual ao anterior → FrameSkipped (sem crops nem modelo)
+    gate = get_frame_gate()
+    if gate is not None:
+        with stage("gate"):
+            gate.check(blob_name, bytes_img, rois)
+
+    # decode só da bounding box das ROIs, à menor resolução útil
+    with stage("decode"):
+        pil, origin, factor = decode_for_rois(
+            bytes_img, [r["quad"] for r in rois], min_side=CROP_MIN_SIDE
+        )
     print(f"[ROI] {len(rois)} recortes para {blob_name}. Ex: {Counter(r['camera_id'] for r in rois)}")
 
     ts = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%SZ")
-    prefix = f"{CROPS_PREFIX}/{rois[0]['camera_id']}_{ts}"
-    pairs, crop_blob_paths = [], []
+    crops = []
+    rois_model, local_dets = [], {}
+    triage = get_triage()
 
     for r in rois:
-        crop_bytes = warp_quad_to_bytes(
-            pil, r["quad"],
-            mime=("image/png" if mime == "image/png" else "image/jpeg"),
-            quality=92
-        )
+        with stage("warp"):
+            warped = warp_quad(pil, map_quad(r["quad"], origin, factor))
+        if triage is not None:
+            with stage("triage"):
+                local, info = triage.decide(r, warped)
+            r["_triage"] = info
+            if local is not None:
+                local_dets[r["roi_id"]] = local
+                incr("triage_local")
+                if not info["audit"]:
+                    continue          # decidido localmente: sem upload nem modelo
+                incr("triage_audited")
+        rois_model.append(r)
+        with stage("encode"):
+            crop_bytes = encode_crop(
+                warped,
+                mime=("image/png" if mime == "image/png" else "image/jpeg"),
+                quality=92
+            )
         ext = ".png" if mime == "image/png" else ".jpg"
-        blob_path = f"{prefix}/roi_{r['roi_id']}{ext}"
-        pairs.append((blob_path, crop_bytes, "image/png" if ext == ".png" else "image/jpeg"))
-        crop_blob_paths.append(blob_path)
-
-    uploaded = upload_bytes_many(pairs)
-    print(f"[UPLOAD] {len(uploaded)} crops → {prefix}/")
+        crops.append((ext, crop_bytes, "image/png" if ext == ".png" else "image/jpeg"))
+
+    # crops endereçados por conteúdo: só sobem os que ainda não existem
+    with stage("upload"):
+        crop_blob_paths, uploaded = store_crops(crops)
+        manifest = write_manifest(
+            rois[0]["camera_id"], blob_name,
+            {r["roi_id"]: p for r, p in zip(rois_model, crop_blob_paths)}, ts,
+        )
+    print(f"[UPLOAD] {uploaded}/{len(crop_blob_paths)} crops novos → {manifest}")
+    if triage is not None:
+        print(f"[TRIAGE] {blob_name}: {len(local_dets)}/{len(rois)} ROIs decididas localmente, "
+              f"{len(rois_model)} para o modelo")
 
-    return blob_name, rois, crop_blob_paths
+    return blob_name, rois_model, crop_blob_paths, local_dets
 
 
 # -------------------------------------------------------------------------
@@ -152,55 +290,135 @@ def _chunks(seq, n):
     for i in range(0, len(seq), n):
         yield seq[i:i+n]
 
+def classify_rois(blob_name: str, rois, crop_blob_paths, emitter=None):
+    """
+    Classifica as ROIs em lotes de OAI_ROI_BATCH; só as que faltam voltam a
+    ser pedidas (até ROI_MAX_REQUEUE vezes). Usado pelo modo síncrono e pelas
+    sobras do modo bulk. Devolve (matched, nº de lotes, último erro).
+    """
+    # gerar SAS URLs para os crops
+    with stage("sas"):
+        sas_urls_all = [make_sas_url(p) for p in crop_blob_paths]
+
+    # fila de ROIs por classificar; só as que faltam voltam a ser pedidas
+    pending = list(zip(rois, sas_urls_all))
+    matched, raw_dumps = {}, []
+    total_batches, last_error = 0, None
+
+    for attempt in range(1 + ROI_MAX_REQUEUE):
+        if not pending:
+            break
+        batches = list(_chunks(pending, OAI_ROI_BATCH))
+        tag = "" if attempt == 0 else f" (re-pedido {attempt}/{ROI_MAX_REQUEUE})"
+        print(f"[MODEL] {blob_name}: processando {len(pending)} ROIs em {len(batches)} lotes de {OAI_ROI_BATCH}{tag}...")
+
+        for bi, batch in enumerate(batches, start=1):
+            rois_batch = [r for r, _ in batch]
+            sas_batch = [s for _, s in batch]
+            print(f"[MODEL] {blob_name} → Lote {bi}/{len(batches)} ({len(rois_batch)} ROIs)")
+            total_batches += 1
+            user_content = build_user_content_for_rois(rois_meta=rois_batch, sas_urls=sas_batch)
+            if STREAM_DETECTIONS:
+                with stage("model"):
+                    got, info, err = classify_batch_stream(rois_batch, user_content, emitter)
+                if err is not None:
+                    print(f"[MODEL] ⚠️ lote {bi} falhou a meio do stream: {err}")
+                    incr("model_errors")
+                    last_error = err
+                matched.update(got)
+                if info["truncated"] or info["errors"] or len(got) < len(rois_batch):
+                    print(
+                        f"[MODEL] ⚠️ lote {bi}: {len(got)}/{len(rois_batch)} ROIs válidas "
+                        f"(truncada={info['truncated']}, objetos inválidos={info['errors']})"
+                    )
+                continue
+            try:
+                with stage("model"):
+                    raw = complete(SYSTEM_PROMPT_ROI, user_content, use_json_mode=True)
+            except Exception as e:
+                print(f"[MODEL] ⚠️ lote {bi} falhou: {e}")
+                incr("model_errors")
+                last_error = e
+                continue
+            raw_dumps.append(raw)
+
+            with stage("parse"):
+                dets, info = parse_detections(raw)
+                got = match_detections(dets, rois_batch)
+            matched.update(got)
+            if info["truncated"] or info["errors"] or len(got) < len(rois_batch):
+                print(
+                    f"[MODEL] ⚠️ lote {bi}: {len(got)}/{len(rois_batch)} ROIs válidas "
+                    f"(truncada={info['truncated']}, objetos inválidos={info['errors']})"
+                )
+
+        pending = [(r, s) for r, s in pending if r["roi_id"] not in matched]
+        if pending and attempt < ROI_MAX_REQUEUE:
+            incr("rois_requeued", len(pending))
+
+    if pending:
+        print(f"[MODEL] ⚠️ {blob_name}: {len(pending)} ROIs sem resposta válida: {[r['roi_id'] for r, _ in pending]}")
+    return matched, total_batches, last_error
+
 def run_snip_and_classify_for_image(blob_name: str, camera_json):
-    image_name, rois, crop_blob_paths = run_snip_only(blob_name, camera_json)
+    image_name, rois, crop_blob_paths, local_dets = run_snip_only(blob_name, camera_json)
 
-    # gerar SAS URLs para os crops
-    sas_urls_all = [make_sas_url(p) for p in crop_blob_paths]
-
-    # dividir em batches
-    batches_rois = list(_chunks(rois, OAI_ROI_BATCH))
-    batches_sas  = list(_chunks(sas_urls_all, OAI_ROI_BATCH))
-    total_batches = len(batches_rois)
-    print(f"[MODEL] {blob_name}: processando {len(rois)} ROIs em {total_batches} lotes de {OAI_ROI_BATCH}...")
-
-    all_detections, raw_dumps = [], []
-
-    for bi, (rois_batch, sas_batch) in enumerate(zip(batches_rois, batches_sas), start=1):
-        print(f"[MODEL] {blob_name} → Lote {bi}/{total_batches} ({len(rois_batch)} ROIs)")
-        user_content = build_user_content_for_rois(rois_meta=rois_batch, sas_urls=sas_batch)
-        raw = complete(SYSTEM_PROMPT_ROI, user_content, use_json_mode=True)
-        raw_dumps.append(raw)
-        try:
-            obj = parse_json(raw)
-        except Exception:
-            obj = json.loads(raw)
-
-        # normaliza formato
-        if isinstance(obj, list):
-            dets = obj
-        elif isinstance(obj, dict) and "detections" in obj:
-            dets = obj["detections"]
-        else:
-            dets = [obj]
-        if not isinstance(dets, list):
-            dets = [dets]
-        all_detections.extend(dets)
+    # decisões locais da triagem seguem já para o backend
+    emitter = get_emitter()
+    if emitter is not None:
+        for det in local_dets.values():
+            _emit(emitter, det)
+
+    matched, total_batches, last_error = classify_rois(blob_name, rois, crop_blob_paths, emitter)
+    if not matched and not local_dets and last_error is not None:
+        raise last_error
+
+    out_json, n_dets = finish_image(blob_name, rois, matched, local_dets)
+    commit_frame(blob_name)
+    print(f"[MODEL] {blob_name} ✓ {n_dets} detections em {total_batches} lotes → {out_json}")
 
+def finish_image(blob_name: str, rois, matched, local_dets):
+    """
+    Junta respostas do modelo e decisões locais, atualiza a triagem e grava o
+    ficheiro da imagem. Usado pelo modo síncrono e pelo modo bulk (app/bulk.py).
+    """
+    # triagem: regista respostas do modelo (estado + auditoria de concordância)
+    triage = get_triage()
+    if triage is not None:
+        for r in rois:
+            if "_triage" not in r:
+                continue          # ROI retomada do job.json do modo bulk (sem miniaturas)
+            agree = triage.record(r, r["_triage"], matched.get(r["roi_id"]))
+            if agree is not None:
+                incr("triage_agree" if agree else "triage_disagree")
+        triage.save()
+
+    # modelo tem prioridade (ROIs auditadas); o resto vem da triagem local
+    all_detections = [matched[r["roi_id"]] for r in rois if r["roi_id"] in matched]
+    all_detections += [d for rid, d in local_dets.items() if rid not in matched]
+
+    out_json = write_image_results(blob_name, all_detections)
+    incr("rois", len({r["roi_id"] for r in rois} | set(local_dets)))
+    incr("detections", len(all_detections))
+    return out_json, len(all_detections)
+
+def write_image_results(blob_name: str, detections) -> str:
     # agrega e CALCULA o índice final antes de gravar
-    results = {"detections": all_detections}
+    results = {"detections": detections}
     results = compute_final_scores(results)
 
     # persistência — 1 ficheiro por imagem/câmara
     os.makedirs("data/input", exist_ok=True)
     ts = time.strftime("%Y%m%d-%H%M%S")
     base = os.path.splitext(os.path.basename(blob_name))[0]  # ex.: '6215'
-    out_json = f"data/input/{base}_roi_response_{ts}.json"
-
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-
-    print(f"[MODEL] {blob_name} ✓ {len(all_detections)} detections em {total_batches} lotes → {out_json}")
+    out_json = f"data/input/{base}_roi_response_{ts}{ext_for(WIRE_FORMAT)}"
+    n = 1
+    while os.path.exists(out_json):   # mesma câmara no mesmo segundo (ex.: modo bulk)
+        out_json = f"data/input/{base}_roi_response_{ts}-{n}{ext_for(WIRE_FORMAT)}"
+        n += 1
+    with stage("persist"):
+        write_file(out_json, results, WIRE_FORMAT)
+    return out_json
 
 
 # -------------------------------------------------------------------------
@@ -215,17 +433,124 @@ def run_for_all_images():
         return
 
     print(f"[BATCH] Encontradas {len(image_names)} imagens para processar.")
+    deferred = []
     for i, blob_name in enumerate(image_names, start=1):
         print(f"\n[BATCH] ({i}/{len(image_names)}) → {blob_name}")
-        try:
+        if not _process_image(blob_name, camera_json):
+            deferred.append((time.time(), blob_name))
+
+    # frames rejeitados pelo filtro: uma nova tentativa no fim da passagem
+    for t_skip, blob_name in deferred:
+        wait = t_skip + FRAME_RETRY_SECONDS - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        print(f"\n[BATCH] nova tentativa → {blob_name}")
+        _process_image(blob_name, camera_json)
+
+def _process_image(blob_name: str, camera_json) -> bool:
+    """Devolve False só se o frame foi rejeitado e vale a pena tentar mais tarde."""
+    try:
+        with stage("image"):
             run_snip_and_classify_for_image(blob_name, camera_json)
-        except Exception as e:
-            print(f"[BATCH] ERRO na imagem {blob_name}: {e}")
+        incr("images")
+    except FrameSkipped as e:
+        print(f"[GATE] {e}")
+        incr(f"frames_{e.reason}")
+        return not e.retry
+    except Exception as e:
+        print(f"[BATCH] ERRO na imagem {blob_name}: {e}")
+        incr("image_errors")
+    return True
+
+
+# -------------------------------------------------------------------------
+# 4. Modo fila: várias réplicas partilham as câmaras via leases
+# -------------------------------------------------------------------------
+def run_from_queue(queue_url: str = WORK_QUEUE_URL, loop: bool = False, concat: bool = True):
+    """
+    Processa jobs da fila até o ciclo ficar esgotado.
+      loop=True   → não sai: espera pelo próximo ciclo (réplicas agent-worker)
+      concat=True → junta data/input no fim de cada ciclo; só um processo o
+                    deve fazer (o agente principal), nunca as réplicas
+    """
+    queue = open_queue(queue_url, max_attempts=WORK_MAX_ATTEMPTS)
+    me = worker_id()
+    camera_json = load_roi_json()
+    cycle, merged, done = None, None, 0
+
+    while True:
+        if current_cycle(AGENT_CYCLE_SECONDS) != cycle:
+            cycle = current_cycle(AGENT_CYCLE_SECONDS)
+            added = queue.enqueue(list_all_images(), cycle)
+            queue.prune(keep_cycles=6, cycle=cycle)
+            print(f"[QUEUE] {me}: ciclo {cycle}, {added} jobs novos. Estado: {queue.counts()}")
+
+        job = queue.lease(me, WORK_LEASE_SECONDS)
+        if job is None:
+            # frames adiados pelo filtro ainda por tentar: espera por eles
+            due = queue.next_due()
+            if due is not None:
+                time.sleep(max(0.5, min(due, WORK_POLL_SECONDS)))
+                continue
+            # ciclo esgotado; o concat espera que as outras réplicas terminem
+            # os jobs que ainda têm (senão os ficheiros delas ficavam de fora)
+            if concat and merged != cycle:
+                busy = {k: v for k, v in queue.counts(cycle).items() if k in ("leased", "pending")}
+                if busy:
+                    print(f"[QUEUE] {me}: à espera das outras réplicas antes do concat: {busy}")
+                    time.sleep(WORK_POLL_SECONDS)
+                    continue
+                concat_json_files(fmt=WIRE_FORMAT)
+                merged = cycle
+            if not loop:
+                break
+            wait = (cycle + 1) * AGENT_CYCLE_SECONDS - time.time()
+            time.sleep(max(0.5, min(wait, WORK_POLL_SECONDS)))
+            continue
+
+        print(f"\n[QUEUE] {me} → {job.blob_name} (tentativa {job.attempts})")
+        with keep_alive(queue, job, me, WORK_LEASE_SECONDS) as lost:
+            try:
+                run_snip_and_classify_for_image(job.blob_name, camera_json)
+            except FrameSkipped as e:
+                print(f"[GATE] {e}")
+                incr(f"frames_{e.reason}")
+                if e.retry:
+                    queue.defer(job, me, delay=FRAME_RETRY_SECONDS)
+                    continue
+            except Exception as e:
+                print(f"[QUEUE] ERRO na imagem {job.blob_name}: {e}")
+                queue.nack(job, me)
+                continue
+        if lost.is_set() or not queue.ack(job, me):
+            print(f"[QUEUE] ⚠️ lease de {job.blob_name} perdido para outra réplica.")
+            continue
+        done += 1
+
+    print(f"[QUEUE] {me}: {done} imagens processadas. Estado: {queue.counts()}")
 
 
 # -------------------------------------------------------------------------
 # Entry point
 # -------------------------------------------------------------------------
 if __name__ == "__main__":
-    run_for_all_images()
-    concat_json_files()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--loop", action="store_true", help="repete a cada AGENT_CYCLE_SECONDS em vez de sair")
+    ap.add_argument("--worker", action="store_true",
+                    help="réplica extra: só consome a fila (WORK_QUEUE_URL), sem concat; implica --loop")
+    args = ap.parse_args()
+    if args.worker and not WORK_QUEUE_URL:
+        raise SystemExit("--worker precisa de WORK_QUEUE_URL")
+
+    try:
+        if WORK_QUEUE_URL:
+            run_from_queue(loop=args.loop or args.worker, concat=not args.worker)
+        else:
+            while True:
+                run_for_all_images()
+                concat_json_files(fmt=WIRE_FORMAT)
+                if not args.loop:
+                    break
+                time.sleep(max(0, AGENT_CYCLE_SECONDS - time.time() % AGENT_CYCLE_SECONDS))
+    finally:
+        close_emitter()
@@ -0,0 +1,67 @@
+# app/metrics.py
+# -------------------------------------------------------------------------
+# Tempos por etapa do pipeline (download, decode, warp, upload, model, ...)
+# Custo quase nulo: só acumula durações em memória; usado pelo benchmark.
+# -------------------------------------------------------------------------
+
+import threading, time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+
+_lock = threading.Lock()
+_durations: Dict[str, List[float]] = defaultdict(list)
+_counters: Dict[str, int] = defaultdict(int)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        with _lock:
+            _durations[name].append(dt)
+
+def observe(name: str, seconds: float):
+    """Regista uma duração medida fora de um bloco (ex.: latência até ao backend)."""
+    with _lock:
+        _durations[name].append(seconds)
+
+def incr(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _counters.clear()
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """etapa → {n, total_s, p50_ms, p95_ms, p99_ms, max_ms}"""
+    with _lock:
+        data = {k: list(v) for k, v in _durations.items()}
+    out = {}
+    for name, vals in data.items():
+        out[name] = {
+            "n": len(vals),
+            "total_s": sum(vals),
+            "p50_ms": percentile(vals, 50) * 1000,
+            "p95_ms": percentile(vals, 95) * 1000,
+            "p99_ms": percentile(vals, 99) * 1000,
+            "max_ms": max(vals) * 1000,
+        }
+    return out
+
+def counters() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,182 @@
+# app/response_parser.py
+# -------------------------------------------------------------------------
+# Parser tolerante das respostas do modelo
+#
+#   DetectionStreamParser → lê o array "detections" incrementalmente e devolve
+#                           cada objecto COMPLETO assim que fecha. Uma resposta
+#                           truncada (max_tokens) ainda devolve tudo o que fechou.
+#   validate_detection    → valida/normaliza uma detecção (pcts 0–100 inteiros)
+#   match_detections      → associa detecções aos roi_id pedidos; o que faltar
+#                           volta para a fila (só essas ROIs são re-pedidas)
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import json, re
+from typing import Any, Dict, List, Optional, Tuple
+
+PCT_FIELDS = ("quantidade_pct", "qualidade_pct", "organizacao_pct", "contexto_pct")
+
+_ARRAY_START = re.compile(r'"detections"\s*:\s*\[')
+
+
+class DetectionStreamParser:
+    """
+    Máquina de estados sobre o texto da resposta (pode receber por partes).
+    Aceita {"detections": [...]}, um array no topo, ou texto à volta (```json).
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0              # próximo carácter a analisar
+        self.in_array = False
+        self.closed = False       # viu o ']' final
+        self.depth = 0
+        self.in_str = False
+        self.esc = False
+        self.obj_start: Optional[int] = None
+        self.errors = 0           # objectos fechados mas JSON inválido
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.buf += chunk
+        out: List[Dict[str, Any]] = []
+
+        if not self.in_array:
+            m = _ARRAY_START.search(self.buf)
+            if m:
+                self.pos = m.end()
+            elif self.buf.lstrip().startswith("["):
+                self.pos = self.buf.index("[") + 1
+            else:
+                return out
+            self.in_array = True
+
+        buf, i, n = self.buf, self.pos, len(self.buf)
+        while i < n and not self.closed:
+            c = buf[i]
+            if self.obj_start is None:
+                if c == "{":
+                    self.obj_start, self.depth = i, 1
+                elif c == "]":
+                    self.closed = True
+                i += 1
+                continue
+
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif c == "\\":
+                    self.esc = True
+                elif c == '"':
+                    self.in_str = False
+            elif c == '"':
+                self.in_str = True
+            elif c in "{[":
+                self.depth += 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        obj = json.loads(buf[self.obj_start:i + 1])
+                        if isinstance(obj, dict):
+                            out.append(obj)
+                        else:
+                            self.errors += 1
+                    except ValueError:
+                        self.errors += 1
+                    self.obj_start = None
+            i += 1
+
+        self.pos = i
+        return out
+
+    @property
+    def truncated(self) -> bool:
+        return self.in_array and not self.closed
+
+
+def parse_detections(text: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Extrai todas as detecções completas de `text`.
+    Devolve (dets, info) com info = {"truncated", "errors", "salvaged"}.
+    """
+    try:
+        obj = json.loads(text)
+    except ValueError:
+        obj = None
+
+    if obj is not None:
+        if isinstance(obj, dict) and isinstance(obj.get("detections"), list):
+            dets = obj["detections"]
+        elif isinstance(obj, list):
+            dets = obj
+        elif isinstance(obj, dict):
+            dets = [obj]          # modelo devolveu uma única detecção sem wrapper
+        else:
+            dets = []
+        good = [d for d in dets if isinstance(d, dict)]
+        return good, {"truncated": False, "errors": len(dets) - len(good), "salvaged": False}
+
+    p = DetectionStreamParser()
+    dets = p.feed(text)
+    return dets, {"truncated": p.truncated, "errors": p.errors, "salvaged": True}
+
+
+# -------------------------------------------------------------------------
+# Validação
+# -------------------------------------------------------------------------
+def _pct(v) -> Optional[int]:
+    if isinstance(v, bool):
+        return None
+    try:
+        return max(0, min(100, int(round(float(v)))))
+    except (TypeError, ValueError):
+        return None
+
+def validate_detection(d: Dict[str, Any], roi: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Normaliza uma detecção para a ROI pedida. Campos de identidade vêm SEMPRE
+    da ROI (o modelo só ecoa); se faltar algum pct a detecção é rejeitada.
+    """
+    out = {
+        "image_name": roi["image_name"],
+        "camera_id": roi["camera_id"],
+        "roi_id": roi["roi_id"],
+        "product_id": roi["product_id"],
+        "product_name": roi["product_name"],
+        "fruit_type": str(d.get("fruit_type") or ""),
+    }
+    for k in PCT_FIELDS:
+        v = _pct(d.get(k))
+        if v is None:
+            return None
+        out[k] = v
+    out["insights"] = str(d.get("insights") or "")
+    try:
+        out["confidence"] = max(0.0, min(1.0, float(d.get("confidence", 0.0))))
+    except (TypeError, ValueError):
+        out["confidence"] = 0.0
+    out["roi_quad_px"] = roi["quad"]
+    return out
+
+def match_detections(dets: List[Dict[str, Any]], rois: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    roi_id → detecção validada. Usa roi_id; se o modelo o omitir, tenta
+    product_id quando é único no lote. Duplicados: fica o primeiro.
+    """
+    by_id = {r["roi_id"]: r for r in rois}
+    by_pid: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rois:
+        by_pid.setdefault(str(r["product_id"]), []).append(r)
+
+    matched: Dict[str, Dict[str, Any]] = {}
+    for d in dets:
+        roi = by_id.get(str(d.get("roi_id", "")))
+        if roi is None:
+            cands = by_pid.get(str(d.get("product_id", "")), [])
+            roi = cands[0] if len(cands) == 1 else None
+        if roi is None or roi["roi_id"] in matched:
+            continue
+        v = validate_detection(d, roi)
+        if v is not None:
+            matched[roi["roi_id"]] = v
+    return matched
@@ -14,7 +14,7 @@ import io, math
 from typing import Dict, List, Tuple
 from PIL import Image
 
-def warp_quad_to_bytes(pil_img: Image.Image, quad: Dict, mime="image/jpeg", quality=92, scale=1.0) -> bytes:
+def warp_quad(pil_img: Image.Image, quad: Dict, scale=1.0) -> Image.Image:
     """
     quad: {'top_left':[x,y], 'top_right':[x,y], 'bottom_right':[x,y], 'bottom_left':[x,y]}
     Faz warp do quadrilátero para um retângulo estimando W/H pelos lados.
@@ -31,8 +31,9 @@ def warp_quad_to_bytes(pil_img: Image.Image, quad: Dict, mime="image/jpeg", qual
     width  = max(8, width); height = max(8, height)
 
     quad_src = (tl[0], tl[1],  bl[0], bl[1],  br[0], br[1],  tr[0], tr[1])
-    warped = pil_img.transform((width, height), QUAD, data=quad_src, resample=BICUBIC)
+    return pil_img.transform((width, height), QUAD, data=quad_src, resample=BICUBIC)
 
+def encode_crop(warped: Image.Image, mime="image/jpeg", quality=92) -> bytes:
     buf = io.BytesIO()
     if mime == "image/png":
         warped.save(buf, format="PNG")
@@ -40,3 +41,86 @@ def warp_quad_to_bytes(pil_img: Image.Image, quad: Dict, mime="image/jpeg", qual
         warped.save(buf, format="JPEG", quality=quality)
     return buf.getvalue()
 
+def warp_quad_to_bytes(pil_img: Image.Image, quad: Dict, mime="image/jpeg", quality=92, scale=1.0) -> bytes:
+    """warp_quad() + encode_crop() num só passo."""
+    return encode_crop(warp_quad(pil_img, quad, scale=scale), mime=mime, quality=quality)
+
+# -------------------------------------------------------------------------
+# Decode reduzido: só a bounding box das ROIs, à menor resolução útil
+# -------------------------------------------------------------------------
+def _quad_points(quad: Dict) -> List[Tuple[float, float]]:
+    return [tuple(quad[k]) for k in ("top_left", "top_right", "bottom_right", "bottom_left")]
+
+def _quad_size(quad: Dict) -> Tuple[float, float]:
+    tl, tr, br, bl = _quad_points(quad)
+    def dist(a, b): return math.hypot(a[0]-b[0], a[1]-b[1])
+    return (dist(tl, tr) + dist(bl, br)) / 2.0, (dist(tl, bl) + dist(tr, br)) / 2.0
+
+def decode_scale_for_rois(quads: List[Dict], min_side: int = 0) -> float:
+    """
+    Menor escala (0–1] que ainda garante crops com pelo menos `min_side` px
+    no lado maior para TODAS as ROIs. min_side <= 0 → resolução original.
+    """
+    if min_side <= 0 or not quads:
+        return 1.0
+    need = 0.0
+    for q in quads:
+        w, h = _quad_size(q)
+        need = max(need, min(1.0, min_side / max(1.0, w, h)))
+    return need or 1.0
+
+def decode_for_rois(data: bytes, quads: List[Dict], min_side: int = 0, pad: int = 4):
+    """
+    Descodifica a imagem só o necessário para recortar as ROIs:
+      - JPEG: usa draft mode (DCT scaling 1/2, 1/4, 1/8) para a menor resolução
+        que satisfaz `min_side`; outros formatos usam reduce() após o crop;
+      - mantém apenas a bounding box de todas as ROIs (+pad px);
+      - só converte para RGB se o modo ainda não for RGB (modos que o
+        reduce() não aceita, ex.: "P", são convertidos antes).
+    Devolve (pil, origin, factor): para mapear um quad original usa map_quad().
+    """
+    img = Image.open(io.BytesIO(data))
+    full_w, full_h = img.size
+    scale = decode_scale_for_rois(quads, min_side)
+
+    if img.format == "JPEG" and scale < 1.0:
+        img.draft("RGB", (math.ceil(full_w * scale), math.ceil(full_h * scale)))
+    factor = img.size[0] / full_w
+
+    # bounding box de todas as ROIs (coords já na resolução descodificada)
+    pts = [p for q in quads for p in _quad_points(q)]
+    if pts:
+        x0 = max(0, math.floor(min(p[0] for p in pts) * factor) - pad)
+        y0 = max(0, math.floor(min(p[1] for p in pts) * factor) - pad)
+        x1 = min(img.size[0], math.ceil(max(p[0] for p in pts) * factor) + pad)
+        y1 = min(img.size[1], math.ceil(max(p[1] for p in pts) * factor) + pad)
+    else:
+        x0, y0, x1, y1 = 0, 0, img.size[0], img.size[1]
+
+    if (x0, y0, x1, y1) != (0, 0, img.size[0], img.size[1]) and x1 > x0 and y1 > y0:
+        pil = img.crop((x0, y0, x1, y1))
+    else:
+        x0, y0 = 0, 0
+        pil = img
+        pil.load()
+
+    # formatos sem DCT scaling: reduzir depois do crop (menos píxeis a processar)
+    k = int(factor / scale) if scale < 1.0 else 1
+    if k >= 2 and pil.size[0] // k >= 8 and pil.size[1] // k >= 8:
+        if pil.mode not in ("RGB", "L", "RGBA"):
+            pil = pil.convert("RGB")       # PNG com paleta, etc.
+        pil = pil.reduce(k)
+        factor /= k
+        x0, y0 = x0 / k, y0 / k
+
+    if pil.mode != "RGB":
+        pil = pil.convert("RGB")
+    return pil, (x0, y0), factor
+
+def map_quad(quad: Dict, origin: Tuple[float, float], factor: float) -> Dict:
+    """Converte um quad em px da imagem original para px da imagem de decode_for_rois()."""
+    ox, oy = origin
+    return {
+        k: [quad[k][0] * factor - ox, quad[k][1] * factor - oy]
+        for k in ("top_left", "top_right", "bottom_right", "bottom_left")
+    }
@@ -0,0 +1,395 @@
+# app/triage.py
+# -------------------------------------------------------------------------
+# Triagem local (CPU) das ROIs antes do modelo de visão
+#
+# Para cada crop calcula estatísticas baratas (saturação, textura, contraste)
+# sobre uma miniatura e decide:
+#   "empty"     → modelo logístico pequeno com P(vazio) >= limiar
+#   "unchanged" → crop quase igual ao último crop que o modelo deu como cheio
+#   None        → incerto: segue para o GPT-4o
+# As decisões locais geram detecções marcadas com scored_by="local".
+# Uma fração (TRIAGE_AUDIT_RATE) das ROIs decididas localmente vai também ao
+# modelo para medir a concordância; tudo fica em data/triage_audit.jsonl,
+# que serve de dados de treino:  python -m app.triage fit data/triage_audit.jsonl
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import fcntl, json, math, os, random
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageFilter, ImageStat
+
+FEATURES = ("sat_mean", "sat_frac", "edge", "lum_std")
+
+# pesos por defeito calibrados com dados reais do repositório:
+#   python -m app.triage calibrate frontend/exec/src/media/*.jpg \
+#       --detections 'data/outputs/*.json' --plan utils/plantest.json
+# 31 ROIs de 3 frames (câmaras 6371, 6373, 6591), rótulo = média da
+# quantidade_pct dada pelo modelo nos outputs válidos (< EMPTY_MAX_PCT → vazio).
+# Só 2 ROIs vazias (caixas de plástico coloridas, pouca textura): com o limiar
+# de 0.9 apenas a caixa mais óbvia fica local. Substituir por `fit` sobre o log
+# de auditoria assim que houver amostras suficientes.
+DEFAULT_WEIGHTS = {"bias": -4.58, "sat_mean": 16.23, "sat_frac": -13.42, "edge": -9.67, "lum_std": -0.96}
+
+EMPTY_INSIGHT = "empty ROI / no product visible. Restock as soon as possible"
+EMPTY_MAX_PCT = 15      # quantidade_pct abaixo disto conta como vazio (guia do prompt)
+
+
+# -------------------------------------------------------------------------
+# Features
+# -------------------------------------------------------------------------
+def roi_features(crop: Image.Image) -> Dict[str, float]:
+    small = crop.convert("RGB").resize((64, 64), Image.BILINEAR)
+    _h, s, v = small.convert("HSV").split()
+    lum = small.convert("L")
+
+    sat_mean = ImageStat.Stat(s).mean[0] / 255.0
+    # fração de píxeis com cor "viva" (S > 0.35 e V > 0.2)
+    mask = Image.eval(s, lambda x: 255 if x > 89 else 0)
+    vmask = Image.eval(v, lambda x: 255 if x > 51 else 0)
+    both = Image.composite(mask, Image.new("L", mask.size, 0), vmask)
+    sat_frac = ImageStat.Stat(both).mean[0] / 255.0
+    edge = ImageStat.Stat(lum.filter(ImageFilter.FIND_EDGES)).mean[0] / 255.0
+    lum_std = ImageStat.Stat(lum).stddev[0] / 255.0
+    return {"sat_mean": sat_mean, "sat_frac": sat_frac, "edge": edge, "lum_std": lum_std}
+
+def thumbnail(crop: Image.Image) -> List[int]:
+    """Miniatura 16x16 em tons de cinzento (para detectar crops inalterados)."""
+    return list(crop.convert("L").resize((16, 16), Image.BILINEAR).getdata())
+
+def thumb_diff(a: List[int], b: List[int]) -> float:
+    if not a or not b or len(a) != len(b):
+        return float("inf")
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+# -------------------------------------------------------------------------
+# Modelo logístico
+# -------------------------------------------------------------------------
+class TriageModel:
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.w = dict(DEFAULT_WEIGHTS if weights is None else weights)
+
+    @classmethod
+    def load(cls, path: str) -> "TriageModel":
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls()
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.w, f, indent=2)
+
+    def p_empty(self, feats: Dict[str, float]) -> float:
+        z = self.w.get("bias", 0.0) + sum(self.w.get(k, 0.0) * feats.get(k, 0.0) for k in FEATURES)
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+    def fit(self, samples: List[Tuple[Dict[str, float], int]], epochs: int = 500, lr: float = 0.5):
+        """Regressão logística por gradiente (amostras: (features, 1 se vazio))."""
+        if not samples:
+            return self
+        for _ in range(epochs):
+            g = {k: 0.0 for k in ("bias",) + FEATURES}
+            for feats, y in samples:
+                err = self.p_empty(feats) - y
+                g["bias"] += err
+                for k in FEATURES:
+                    g[k] += err * feats.get(k, 0.0)
+            for k, v in g.items():
+                self.w[k] = self.w.get(k, 0.0) - lr * v / len(samples)
+        return self
+
+
+# -------------------------------------------------------------------------
+# Triagem
+# -------------------------------------------------------------------------
+def local_detection(roi: Dict, kind: str, p: float, previous: Optional[Dict] = None) -> Dict:
+    det = {
+        "image_name": roi["image_name"],
+        "camera_id": roi["camera_id"],
+        "roi_id": roi["roi_id"],
+        "product_id": roi["product_id"],
+        "product_name": roi["product_name"],
+    }
+    if kind == "empty":
+        det.update({
+            "fruit_type": "", "quantidade_pct": 0, "qualidade_pct": 0,
+            "organizacao_pct": 0, "contexto_pct": 0, "insights": EMPTY_INSIGHT,
+        })
+    else:  # unchanged → reaproveita a última avaliação do modelo
+        for k in ("fruit_type", "quantidade_pct", "qualidade_pct", "organizacao_pct",
+                  "contexto_pct", "insights"):
+            det[k] = (previous or {}).get(k, 0)
+    det["confidence"] = round(p, 3)
+    det["roi_quad_px"] = roi["quad"]
+    det["scored_by"] = "local"
+    det["triage"] = kind
+    return det
+
+
+class Triage:
+    """
+    Estado persistido por câmara em `state_dir/{camera_id}.json`: por roi_id
+    guarda a miniatura e a última detecção do MODELO (base do caso
+    "unchanged"). Réplicas que partilham câmaras pela fila não se pisam: o
+    ficheiro é relido sempre que muda (mtime) e save() junta só as ROIs
+    registadas por este processo ao estado atual, sob um lock do ficheiro.
+    """
+
+    def __init__(self, model: TriageModel, empty_threshold: float = 0.9,
+                 unchanged_max_diff: float = 6.0, full_min_pct: int = 90,
+                 audit_rate: float = 0.1, state_dir: str = "data/triage",
+                 audit_path: str = "data/triage_audit.jsonl", seed: Optional[int] = None):
+        self.model = model
+        self.empty_threshold = empty_threshold
+        self.unchanged_max_diff = unchanged_max_diff
+        self.full_min_pct = full_min_pct
+        self.audit_rate = audit_rate
+        self.state_dir = state_dir
+        self.audit_path = audit_path
+        self.rnd = random.Random(seed)
+        self._states: Dict[str, Tuple[Optional[int], Dict[str, Dict]]] = {}  # câmara → (mtime_ns, estado)
+        self._changes: Dict[str, Dict[str, Dict]] = {}                      # câmara → ROIs ainda por gravar
+
+    @staticmethod
+    def key(roi: Dict) -> str:
+        return f"{roi['camera_id']}|{roi['roi_id']}"
+
+    def _state_path(self, camera_id: str) -> str:
+        return os.path.join(self.state_dir, f"{camera_id}.json")
+
+    def _mtime(self, camera_id: str) -> Optional[int]:
+        try:
+            return os.stat(self._state_path(camera_id)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self, camera_id: str) -> Dict[str, Dict]:
+        """Estado da câmara tal como está no disco (e guarda-o em cache com o mtime)."""
+        mtime, state = self._mtime(camera_id), {}
+        if mtime is not None:
+            try:
+                with open(self._state_path(camera_id), "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except Exception as e:
+                print(f"[TRIAGE] ⚠️ estado de {camera_id} ignorado ({e})")
+        self._states[camera_id] = (mtime, state)
+        return state
+
+    def _cam_state(self, camera_id: str) -> Dict[str, Dict]:
+        if not self.state_dir:
+            state = self._states.get(camera_id, (None, {}))[1]
+        elif camera_id in self._states and self._states[camera_id][0] == self._mtime(camera_id):
+            state = self._states[camera_id][1]
+        else:
+            state = self._read(camera_id)        # outra réplica gravou entretanto
+        changes = self._changes.get(camera_id)
+        return dict(state, **changes) if changes else state
+
+    @contextmanager
+    def _locked(self, camera_id: str):
+        with open(self._state_path(camera_id) + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def decide(self, roi: Dict, crop: Image.Image) -> Tuple[Optional[Dict], Dict]:
+        """
+        Devolve (detecção local ou None, info). info vai guardada na ROI e é
+        usada por record() depois da resposta do modelo.
+        """
+        feats = roi_features(crop)
+        thumb = thumbnail(crop)
+        info = {"features": feats, "thumb": thumb, "audit": False, "local": None}
+
+        p = self.model.p_empty(feats)
+        det = None
+        if p >= self.empty_threshold:
+            det = local_detection(roi, "empty", p)
+        else:
+            prev = self._cam_state(roi["camera_id"]).get(roi["roi_id"])
+            if prev and int(prev["detection"].get("quantidade_pct", 0)) >= self.full_min_pct:
+                diff = thumb_diff(thumb, prev["thumb"])
+                if diff <= self.unchanged_max_diff:
+                    conf = max(0.0, 1.0 - diff / max(1e-6, self.unchanged_max_diff) * 0.5)
+                    det = local_detection(roi, "unchanged", conf, prev["detection"])
+
+        if det is not None:
+            info["local"] = det
+            info["audit"] = self.rnd.random() < self.audit_rate
+        return det, info
+
+    def record(self, roi: Dict, info: Dict, model_det: Optional[Dict]) -> Optional[bool]:
+        """
+        Regista a resposta do modelo: atualiza o estado e, se a ROI foi
+        auditada, devolve se o modelo concorda com a decisão local.
+        """
+        if model_det is None:
+            return None
+        self._changes.setdefault(roi["camera_id"], {})[roi["roi_id"]] = {"thumb": info["thumb"], "detection": {
+            k: model_det.get(k) for k in ("fruit_type", "quantidade_pct", "qualidade_pct",
+                                          "organizacao_pct", "contexto_pct", "insights")
+        }}
+
+        agree = None
+        local = info.get("local")
+        if local is not None:
+            q = int(model_det.get("quantidade_pct", 0))
+            if local["triage"] == "empty":
+                agree = q < EMPTY_MAX_PCT
+            else:
+                agree = abs(q - int(local.get("quantidade_pct", 0))) <= 15
+
+        self._log({
+            "key": self.key(roi),
+            "features": info["features"],
+            "model_quantidade_pct": model_det.get("quantidade_pct"),
+            "local": local["triage"] if local else None,
+            "audit": info["audit"],
+            "agree": agree,
+        })
+        return agree
+
+    def _log(self, row: Dict):
+        if not self.audit_path:
+            return
+        d = os.path.dirname(self.audit_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with open(self.audit_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(row) + "\n")
+
+    def save(self):
+        """Junta as ROIs registadas ao estado ATUAL de cada câmara (relido sob lock) e grava."""
+        if not self.state_dir:
+            for cam, changes in self._changes.items():
+                self._states[cam] = (None, dict(self._states.get(cam, (None, {}))[1], **changes))
+            self._changes.clear()
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        for cam in sorted(self._changes):
+            path = self._state_path(cam)
+            with self._locked(cam):
+                state = self._read(cam)
+                state.update(self._changes[cam])
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp, path)
+                self._states[cam] = (self._mtime(cam), state)
+        self._changes.clear()
+
+
+# -------------------------------------------------------------------------
+# CLI: treinar / avaliar a partir do log de auditoria
+# -------------------------------------------------------------------------
+def _load_samples(path: str) -> List[Tuple[Dict[str, float], int]]:
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                q = row.get("model_quantidade_pct")
+                if q is None:
+                    continue
+                samples.append((row["features"], 1 if int(q) < EMPTY_MAX_PCT else 0))
+            except Exception:
+                continue
+    return samples
+
+def _plan_rois(plan: Dict, cam_id: str) -> List[Tuple[str, Dict]]:
+    """(roi_id, quad) da câmara, com os mesmos roi_id que o agente (main.extract_rois_flex)."""
+    cams = plan.get("Frutas e Legumes", plan).get("cameras", {})
+    need = ("top_left", "top_right", "bottom_right", "bottom_left")
+    out = []
+    for idx, p in enumerate((cams.get(cam_id) or {}).get("products", []), start=1):
+        coords = p.get("image_coordinates") or {}
+        if all(k in coords for k in need):
+            out.append((f"{p.get('product_id', 'roi')}_{idx}", {k: coords[k] for k in need}))
+    return out
+
+def _calibration_samples(images: List[str], detections: str, plan_path: str):
+    """Features dos crops de frames reais + rótulo dos outputs do modelo para os mesmos frames."""
+    import glob
+    from .snip import warp_quad
+
+    scores: Dict[Tuple[str, str], List[int]] = {}
+    for path in sorted(glob.glob(detections)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                dets = json.load(f).get("detections") or []
+        except ValueError:
+            print(f"[TRIAGE] ignorado {path} (JSON inválido)")
+            continue
+        for d in dets:
+            if isinstance(d.get("quantidade_pct"), (int, float)):
+                scores.setdefault((str(d.get("camera_id")), str(d.get("roi_id"))), []).append(d["quantidade_pct"])
+
+    with open(plan_path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    samples = []
+    for img_path in images:
+        cam_id = os.path.splitext(os.path.basename(img_path))[0]
+        img = Image.open(img_path).convert("RGB")
+        for roi_id, quad in _plan_rois(plan, cam_id):
+            q = scores.get((cam_id, roi_id))
+            if q:
+                samples.append((roi_features(warp_quad(img, quad)), 1 if sum(q) / len(q) < EMPTY_MAX_PCT else 0))
+    return samples
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    f = sub.add_parser("fit", help="treina os pesos a partir do log de auditoria")
+    f.add_argument("audit", default="data/triage_audit.jsonl", nargs="?")
+    f.add_argument("--out", default="data/triage_model.json")
+    c = sub.add_parser("calibrate", help="pesos iniciais a partir de frames reais e outputs do modelo")
+    c.add_argument("images", nargs="+")
+    c.add_argument("--detections", default="data/outputs/*.json")
+    c.add_argument("--plan", default="utils/plantest.json")
+    c.add_argument("--out", default="", help="grava os pesos (senão só imprime)")
+    r = sub.add_parser("report", help="taxa de decisões locais e concordância")
+    r.add_argument("audit", default="data/triage_audit.jsonl", nargs="?")
+    args = ap.parse_args()
+
+    if args.cmd == "fit":
+        samples = _load_samples(args.audit)
+        model = TriageModel().fit(samples)
+        model.save(args.out)
+        acc = sum((model.p_empty(x) >= 0.5) == bool(y) for x, y in samples) / max(1, len(samples))
+        print(f"[TRIAGE] {len(samples)} amostras, accuracy treino {acc:.1%} → {args.out}")
+        return
+
+    if args.cmd == "calibrate":
+        samples = _calibration_samples(args.images, args.detections, args.plan)
+        # parte de pesos a zero: o resultado não depende dos pesos por defeito atuais
+        model = TriageModel({k: 0.0 for k in ("bias",) + FEATURES}).fit(samples, epochs=5000, lr=2.0)
+        model.w = {k: round(v, 2) for k, v in model.w.items()}
+        empties = sum(y for _x, y in samples)
+        ps = sorted(((model.p_empty(x), y) for x, y in samples), reverse=True)
+        print(f"[TRIAGE] {len(samples)} ROIs ({empties} vazias) → {json.dumps(model.w)}")
+        print("[TRIAGE] maiores P(vazio): " + ", ".join(f"{p:.3f}{'*' if y else ''}" for p, y in ps[:5]))
+        if args.out:
+            model.save(args.out)
+        return
+
+    rows = []
+    with open(args.audit, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+    audited = [x for x in rows if x.get("audit")]
+    agree = sum(1 for x in audited if x.get("agree"))
+    print(f"[TRIAGE] {len(rows)} ROIs vistas pelo modelo, {len(audited)} auditorias, "
+          f"concordância {agree / max(1, len(audited)):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,19 +10,20 @@
 #                                                                              #
 # **************************************************************************** #
 
-import json, re
-from typing import List, Dict
+from typing import Iterator
 from openai import AzureOpenAI
 from .env import (
     AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_VERSION,
-    AZURE_OPENAI_DEPLOYMENT, TEMPERATURE, MAX_TOKENS
+    AZURE_OPENAI_DEPLOYMENT, TEMPERATURE, MAX_TOKENS, OAI_MAX_RETRIES
 )
 
 def _client() -> AzureOpenAI:
+    """Cliente Azure OpenAI (chat, files e batches)."""
     return AzureOpenAI(
         api_key=AZURE_OPENAI_API_KEY,
         api_version=AZURE_OPENAI_API_VERSION,
         azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        max_retries=OAI_MAX_RETRIES,   # o SDK faz backoff e respeita retry-after nos 429
     )
 
 def call_vision(user_content: list, use_json_mode: bool = True) -> str:
@@ -39,8 +40,8 @@ def call_vision(user_content: list, use_json_mode: bool = True) -> str:
     # definimos o system no final para manter legibilidade
     return kwargs, client
 
-def complete(system_prompt: str, user_content: list, use_json_mode: bool = True) -> str:
-    client = _client()
+def request_body(system_prompt: str, user_content: list, use_json_mode: bool = True) -> dict:
+    """Corpo do pedido chat/completions (também usado nas linhas JSONL do modo bulk)."""
     kwargs = {
         "model": AZURE_OPENAI_DEPLOYMENT,
         "temperature": TEMPERATURE,   # recomendo 0.1–0.2 para menos alucinação
@@ -52,13 +53,23 @@ def complete(system_prompt: str, user_content: list, use_json_mode: bool = True)
     }
     if use_json_mode:
         kwargs["response_format"] = {"type": "json_object"}
+    return kwargs
+
+def complete(system_prompt: str, user_content: list, use_json_mode: bool = True) -> str:
+    client = _client()
+    kwargs = request_body(system_prompt, user_content, use_json_mode)
     resp = client.chat.completions.create(**kwargs)
     return resp.choices[0].message.content or ""
 
-def parse_json(text: str):
-    try:
-        return json.loads(text)
-    except Exception:
-        m = re.search(r"\{.*\}|\[.*\]", text, re.DOTALL)
-        if not m: raise
-        return json.loads(m.group(0))
+def complete_stream(system_prompt: str, user_content: list, use_json_mode: bool = True) -> Iterator[str]:
+    """Como complete(), mas devolve o texto por partes à medida que o modelo o gera."""
+    client = _client()
+    kwargs = request_body(system_prompt, user_content, use_json_mode)
+    kwargs["stream"] = True
+    for chunk in client.chat.completions.create(**kwargs):
+        # o Azure envia chunks sem choices (resultados do filtro de conteúdo)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
@@ -0,0 +1,253 @@
+# app/work_queue.py
+# -------------------------------------------------------------------------
+# Fila de trabalho partilhada entre réplicas do agente (sharding de câmaras)
+#
+# Cada imagem de câmara é um "job" identificado por (ciclo, blob_name).
+# Uma réplica só processa um job depois de obter um lease:
+#   - lease()      → reclama o próximo job livre (ou com lease expirado)
+#   - heartbeat()  → prolonga o lease enquanto o job está a correr
+#   - ack()/nack() → termina o job (nack devolve-o à fila ou marca 'failed')
+#   - defer()      → devolve-o à fila mais tarde sem gastar uma tentativa
+# Se uma réplica morrer, o lease expira (visibility timeout) e outra réplica
+# volta a pegar no job automaticamente — até max_attempts: um job que mata
+# a réplica (OOM, crash) acaba 'failed' em vez de circular para sempre.
+#
+# Implementação local: SQLite (ficheiro partilhado no volume data/).
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import os, socket, sqlite3, threading, time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+
+@dataclass
+class Job:
+    job_id: str
+    blob_name: str
+    cycle: int
+    attempts: int
+    lease_until: float
+
+
+def worker_id() -> str:
+    """Identificador único desta réplica (hostname do container + pid)."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def current_cycle(cycle_seconds: int) -> int:
+    """Ciclo actual: todas as réplicas no mesmo intervalo partilham os mesmos jobs."""
+    return int(time.time() // max(1, cycle_seconds))
+
+
+class SqliteWorkQueue:
+    """
+    Fila com leases sobre SQLite. Todas as transições de estado são feitas com
+    BEGIN IMMEDIATE, por isso duas réplicas nunca obtêm o mesmo job ao mesmo tempo.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._conn() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id      TEXT PRIMARY KEY,
+                    blob_name   TEXT NOT NULL,
+                    cycle       INTEGER NOT NULL,
+                    state       TEXT NOT NULL DEFAULT 'pending',
+                    owner       TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    attempts    INTEGER NOT NULL DEFAULT 0,
+                    updated_at  REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, lease_until)")
+
+    @contextmanager
+    def _conn(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _tx(self):
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    # ---------------------------------------------------------------------
+    def enqueue(self, blob_names: Iterable[str], cycle: int) -> int:
+        """
+        Insere um job por imagem para este ciclo. Idempotente: várias réplicas
+        podem enfileirar o mesmo ciclo sem duplicar trabalho.
+        """
+        now = time.time()
+        rows = [(f"{cycle}:{b}", b, cycle, now) for b in blob_names]
+        with self._tx() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs(job_id, blob_name, cycle, updated_at) VALUES (?,?,?,?)",
+                rows,
+            )
+            return db.total_changes - before
+
+    def lease(self, owner: str, lease_seconds: float) -> Optional[Job]:
+        """Reclama o próximo job pendente ou com lease expirado (mais antigo primeiro)."""
+        now = time.time()
+        with self._tx() as db:
+            # leases expirados que já gastaram as tentativas todas
+            db.execute(
+                """
+                UPDATE jobs SET state = 'failed', owner = NULL, updated_at = ?
+                WHERE state = 'leased' AND lease_until < ? AND attempts >= ?
+                """,
+                (now, now, self.max_attempts),
+            )
+            row = db.execute(
+                """
+                SELECT job_id, blob_name, cycle, attempts FROM jobs
+                WHERE (state = 'pending' AND lease_until <= ?) OR (state = 'leased' AND lease_until < ?)
+                ORDER BY cycle, updated_at LIMIT 1
+                """,
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, blob_name, cycle, attempts = row
+            until = now + lease_seconds
+            db.execute(
+                """
+                UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?,
+                                attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (owner, until, now, job_id),
+            )
+            return Job(job_id, blob_name, cycle, attempts + 1, until)
+
+    def heartbeat(self, job: Job, owner: str, lease_seconds: float) -> bool:
+        """Prolonga o lease. Devolve False se o job já não pertence a esta réplica."""
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                """
+                UPDATE jobs SET lease_until = ?, updated_at = ?
+                WHERE job_id = ? AND owner = ? AND state = 'leased'
+                """,
+                (now + lease_seconds, now, job.job_id, owner),
+            )
+            ok = cur.rowcount == 1
+        if ok:
+            job.lease_until = now + lease_seconds
+        return ok
+
+    def ack(self, job: Job, owner: str) -> bool:
+        with self._tx() as db:
+            cur = db.execute(
+                "UPDATE jobs SET state = 'done', updated_at = ? WHERE job_id = ? AND owner = ?",
+                (time.time(), job.job_id, owner),
+            )
+            return cur.rowcount == 1
+
+    def nack(self, job: Job, owner: str, delay: float = 0.0) -> bool:
+        """
+        Devolve o job à fila (só volta a ser entregue daqui a `delay` s);
+        ao fim de max_attempts fica 'failed'.
+        """
+        state = "failed" if job.attempts >= self.max_attempts else "pending"
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                """
+                UPDATE jobs SET state = ?, owner = NULL, lease_until = ?, updated_at = ?
+                WHERE job_id = ? AND owner = ?
+                """,
+                (state, now + delay if delay > 0 else 0, now, job.job_id, owner),
+            )
+            return cur.rowcount == 1
+
+    def defer(self, job: Job, owner: str, delay: float) -> bool:
+        """
+        Como nack(delay), mas esta entrega não conta como tentativa (frame
+        adiado pelo filtro não é uma falha): nunca leva o job a 'failed'.
+        """
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                """
+                UPDATE jobs SET state = 'pending', owner = NULL, lease_until = ?, updated_at = ?,
+                                attempts = MAX(attempts - 1, 0)
+                WHERE job_id = ? AND owner = ?
+                """,
+                (now + delay, now, job.job_id, owner),
+            )
+            return cur.rowcount == 1
+
+    def next_due(self) -> Optional[float]:
+        """Segundos até o próximo job adiado ficar disponível (None se não houver nenhum)."""
+        with self._conn() as db:
+            (due,) = db.execute("SELECT MIN(lease_until) FROM jobs WHERE state = 'pending'").fetchone()
+        return None if due is None else max(0.0, due - time.time())
+
+    def prune(self, keep_cycles: int, cycle: int) -> int:
+        """Remove jobs de ciclos antigos (já terminados ou não)."""
+        with self._tx() as db:
+            cur = db.execute("DELETE FROM jobs WHERE cycle < ?", (cycle - keep_cycles,))
+            return cur.rowcount
+
+    def counts(self, cycle: Optional[int] = None) -> dict:
+        """Nº de jobs por estado (só do ciclo `cycle`, se indicado)."""
+        with self._conn() as db:
+            if cycle is None:
+                return dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            return dict(db.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE cycle = ? GROUP BY state", (cycle,)
+            ).fetchall())
+
+
+def open_queue(url: str, max_attempts: int = 3) -> SqliteWorkQueue:
+    """
+    Abre a fila a partir de WORK_QUEUE_URL.
+    Suportado: 'sqlite:///caminho/relativo.db' ou 'sqlite:////caminho/absoluto.db'.
+    """
+    if url.startswith("sqlite:///"):
+        return SqliteWorkQueue(url[len("sqlite:///"):], max_attempts=max_attempts)
+    raise RuntimeError(f"WORK_QUEUE_URL não suportado: {url}")
+
+
+@contextmanager
+def keep_alive(queue: SqliteWorkQueue, job: Job, owner: str, lease_seconds: float):
+    """
+    Corre heartbeats em background (a cada 1/3 do lease) enquanto o bloco executa.
+    O evento devolvido fica set se o lease for perdido para outra réplica.
+    """
+    stop, lost = threading.Event(), threading.Event()
+
+    def beat():
+        while not stop.wait(lease_seconds / 3.0):
+            try:
+                if not queue.heartbeat(job, owner, lease_seconds):
+                    lost.set()
+                    return
+            except Exception as e:
+                print(f"[QUEUE] ⚠️ heartbeat falhou para {job.blob_name}: {e}")
+
+    t = threading.Thread(target=beat, daemon=True)
+    t.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        t.join()
@@ -6,7 +6,7 @@ echo "[AGENT] Iniciando file_poller..."
 python -m backend.file_poller \
   --dir data/outputs \
   --backend http://backend:8000/ingest \
-  --pattern roi_response_*.json &
+  --pattern 'roi_response_*' &
 
 echo "[AGENT] Iniciando loop do agente..."
-python -m app.main || echo "[AGENT] app.main terminou com código $?"
+python -m app.main --loop || echo "[AGENT] app.main terminou com código $?"
@@ -0,0 +1,158 @@
+# backend/aggregates.py
+# -------------------------------------------------------------------------
+# Resumos por produto mantidos de forma incremental
+#
+# Cada detecção (id "camera|roi") contribui para dois agregados:
+#   (câmara, produto) → resumo da câmara (campo "summary" do frame)
+#   produto           → vista da loja inteira (GET /summary)
+# Quando uma ROI volta a chegar, a contribuição anterior é retirada e a nova
+# somada: O(1) por detecção, sem recalcular o resto das ROIs.
+# min/max usam um histograma dos scores (inteiros 0–100), por isso também
+# se podem retirar valores.
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_STATUS_KEY = {"empty": "empties", "low": "lows", "ok": "oks", "full": "fulls"}
+_METRICS = (("quantidade_pct", "sum_quantidade"), ("qualidade_pct", "sum_qualidade"),
+            ("organizacao_pct", "sum_organizacao"), ("contexto_pct", "sum_contexto"))
+
+# contribuição de uma detecção: (camera_id, product_id, product_name, score, q, ql, o, c, status)
+Contrib = Tuple[str, Any, Any, int, float, float, float, float, str]
+
+
+class ProductAgg:
+    __slots__ = ("product_id", "product_name", "count", "sum_score", "sum_quantidade",
+                 "sum_qualidade", "sum_organizacao", "sum_contexto", "scores", "status")
+
+    def __init__(self, product_id, product_name):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.count = 0
+        self.sum_score = 0
+        self.sum_quantidade = self.sum_qualidade = self.sum_organizacao = self.sum_contexto = 0.0
+        self.scores: Dict[int, int] = defaultdict(int)     # histograma score → nº
+        self.status = {"empties": 0, "lows": 0, "oks": 0, "fulls": 0}
+
+    def apply(self, c: Contrib, sign: int):
+        _cam, _pid, name, score, q, ql, o, ctx, status = c
+        if sign > 0 and name:
+            self.product_name = name
+        self.count += sign
+        self.sum_score += sign * score
+        self.sum_quantidade += sign * q
+        self.sum_qualidade += sign * ql
+        self.sum_organizacao += sign * o
+        self.sum_contexto += sign * ctx
+        self.status[_STATUS_KEY[status]] += sign
+        self.scores[score] += sign
+        if self.scores[score] == 0:
+            del self.scores[score]
+
+    def view(self) -> Dict[str, Any]:
+        n = self.count
+        return {
+            "product_id": self.product_id,
+            "product_name": self.product_name,
+            "count": n,
+            "avg_score": self.sum_score / n,
+            "min_score": min(self.scores),
+            "max_score": max(self.scores),
+            "avg_quantidade_pct": self.sum_quantidade / n,
+            "avg_qualidade_pct": self.sum_qualidade / n,
+            "avg_organizacao_pct": self.sum_organizacao / n,
+            "avg_contexto_pct": self.sum_contexto / n,
+            **self.status,
+        }
+
+
+def contribution(e: Dict[str, Any]) -> Contrib:
+    """Detecção enriquecida (ver /ingest) → contribuição para os agregados."""
+    return (
+        e["camera_id"], e["product_id"], e["product_name"], int(e["score"]),
+        *(float(e.get(k) or 0) for k, _ in _METRICS), e["status"],
+    )
+
+
+class SummaryIndex:
+    def __init__(self):
+        self._contrib: Dict[str, Contrib] = {}                     # id → contribuição atual
+        self._by_cam: Dict[str, Dict[Any, ProductAgg]] = defaultdict(dict)
+        self._cam_ids: Dict[str, set] = defaultdict(set)           # camera_id → ids
+        self._by_product: Dict[Any, ProductAgg] = {}
+        self._cams_per_product: Dict[Any, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    # ------------------ atualização ------------------
+    def _apply(self, c: Contrib, sign: int):
+        cam, pid, name = c[0], c[1], c[2]
+        for table in (self._by_cam[cam], self._by_product):
+            agg = table.get(pid)
+            if agg is None:
+                agg = table[pid] = ProductAgg(pid, name)
+            agg.apply(c, sign)
+            if agg.count == 0:
+                del table[pid]
+        per = self._cams_per_product[pid]
+        per[cam] += sign
+        if per[cam] == 0:
+            del per[cam]
+            if not per:
+                del self._cams_per_product[pid]
+
+    def update(self, e: Dict[str, Any]) -> bool:
+        """Aplica uma detecção (retira a anterior com o mesmo id). False se não mudou nada."""
+        new = contribution(e)
+        old = self._contrib.get(e["id"])
+        if old == new:
+            return False
+        if old is not None:
+            self._apply(old, -1)
+            if old[0] != new[0]:
+                self._cam_ids[old[0]].discard(e["id"])
+        self._apply(new, +1)
+        self._contrib[e["id"]] = new
+        self._cam_ids[new[0]].add(e["id"])
+        return True
+
+    def remove(self, det_id: str):
+        old = self._contrib.pop(det_id, None)
+        if old is not None:
+            self._apply(old, -1)
+            self._cam_ids[old[0]].discard(det_id)
+
+    def replace_camera(self, camera_id: str, enriched: Iterable[Dict[str, Any]]):
+        """Frame completo: as ROIs da câmara que não vierem são retiradas."""
+        keep = set()
+        for e in enriched:
+            keep.add(e["id"])
+            self.update(e)
+        for det_id in self._cam_ids.get(camera_id, set()) - keep:
+            self.remove(det_id)
+
+    # ------------------ vistas ------------------
+    def camera_summary(self, camera_id: str) -> List[Dict[str, Any]]:
+        return [agg.view() for agg in self._by_cam.get(camera_id, {}).values()]
+
+    def product_summary(self, product_id: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """Vista da loja por produto (todas as câmaras)."""
+        out = []
+        for pid, agg in self._by_product.items():
+            if product_id is not None and str(pid) != str(product_id):
+                continue
+            v = agg.view()
+            v["cameras"] = sorted(self._cams_per_product.get(pid, {}))
+            out.append(v)
+        return out
+
+    def totals(self) -> Dict[str, Any]:
+        aggs = list(self._by_product.values())
+        n = sum(a.count for a in aggs)
+        return {
+            "cameras": sum(1 for ids in self._cam_ids.values() if ids),
+            "products": len(aggs),
+            "rois": n,
+            "avg_score": sum(a.sum_score for a in aggs) / n if n else 0.0,
+            **{k: sum(a.status[k] for a in aggs) for k in ("empties", "lows", "oks", "fulls")},
+        }
@@ -0,0 +1,71 @@
+# backend/bench_wire.py
+# -------------------------------------------------------------------------
+# Benchmark dos formatos de transporte das detections (shared/wire.py)
+#
+# Uso:
+#   python -m backend.bench_wire data/outputs/*.json --scale 50
+# --scale replica as detections (simula uma loja com mais câmaras).
+# -------------------------------------------------------------------------
+
+import argparse, json, statistics, time
+
+from shared import wire
+
+
+def _load(paths):
+    dets = []
+    for p in paths:
+        try:
+            dets.extend(wire.read_file(p).get("detections") or [])
+        except Exception as e:
+            print(f"[BENCH] ignorado {p}: {e}")
+    return dets
+
+def _time(fn, repeat):
+    ts = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        ts.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(ts), out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--scale", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    dets = _load(args.files)
+    if not dets:
+        print("[BENCH] sem detections para medir.")
+        return
+    payload = {"detections": [dict(d, camera_id=f"{d.get('camera_id')}-{i}")
+                              for i in range(args.scale) for d in dets]}
+    print(f"[BENCH] {len(payload['detections'])} detections, {args.repeat} repetições\n")
+
+    cases = {
+        "json indent (antigo)": (
+            lambda: json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"),
+            lambda b: json.loads(b),
+        ),
+        "json compacto": (
+            lambda: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            lambda b: json.loads(b),
+        ),
+    }
+    if wire.orjson is not None:
+        cases["orjson"] = (lambda: wire.encode(payload, "json"), lambda b: wire.decode(b, "json"))
+    if wire.msgpack is not None:
+        cases["msgpack colunar"] = (lambda: wire.encode(payload, "msgpack"), lambda b: wire.decode(b, "msgpack"))
+
+    print(f"{'formato':<22}{'bytes':>11}{'encode ms':>11}{'decode ms':>11}")
+    for name, (enc, dec) in cases.items():
+        enc_ms, data = _time(enc, args.repeat)
+        dec_ms, back = _time(lambda: dec(data), args.repeat)
+        assert len(back["detections"]) == len(payload["detections"])
+        print(f"{name:<22}{len(data):>11}{enc_ms:>11.2f}{dec_ms:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
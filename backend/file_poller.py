@@ -1,17 +1,28 @@
 # file_poller.py
-import argparse, json, time
+import argparse, time
 from pathlib import Path
 import requests
 
+from shared.wire import fmt_for_path, mime_for
+
 def is_final_json(p: Path):
-    return p.suffix == ".json" and ".raw." not in p.name and not p.name.endswith(".raw.json")
+    return p.suffix in (".json", ".msgpack") and ".raw." not in p.name and not p.name.endswith(".raw.json")
+
+def post_file(p: Path, backend: str):
+    # envia os bytes tal como estão no disco (sem re-serializar)
+    with open(p, "rb") as f:
+        data = f.read()
+    headers = {"Content-Type": mime_for(fmt_for_path(p.name))}
+    r = requests.post(backend, data=data, headers=headers, timeout=15)
+    r.raise_for_status()      # 4xx/5xx → não conta como enviado, tenta outra vez
+    return r
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--dir", default="data/outputs")
     # aqui já podemos colocar o default certo para docker:
     ap.add_argument("--backend", default="http://backend:8000/ingest")
-    ap.add_argument("--pattern", default="roi_response_*.json")
+    ap.add_argument("--pattern", default="roi_response_*")
     ap.add_argument("--interval", type=float, default=1.0)
     args = ap.parse_args()
 
@@ -26,31 +37,25 @@ def main():
     if files:
         latest = max(files, key=lambda p: p.stat().st_mtime)
         try:
-            with open(latest, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            requests.post(args.backend, json=data, timeout=15)
+            post_file(latest, args.backend)
             seen.add(latest.resolve())
         except Exception as e:
             print(f"[WARN] falha enviando inicial {latest}: {e}")
 
     print(f"[polling] {dirp} (cada {args.interval}s)")
-    last_mtime = 0
     while True:
-        for p in dirp.glob(args.pattern):
-            if not is_final_json(p): 
-                continue
+        # mais antigos primeiro; um ficheiro só fica "visto" depois de um 2xx
+        files = sorted((p for p in dirp.glob(args.pattern) if is_final_json(p)), key=lambda p: p.stat().st_mtime)
+        for p in files:
             rp = p.resolve()
-            mtime = p.stat().st_mtime
-            if rp not in seen and mtime > last_mtime:
-                try:
-                    with open(p, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    requests.post(args.backend, json=data, timeout=15)
-                    print(f"[OK] {p.name}")
-                    seen.add(rp)
-                    last_mtime = mtime
-                except Exception as e:
-                    print(f"[WARN] falha lendo {p}: {e}")
+            if rp in seen:
+                continue
+            try:
+                post_file(p, args.backend)
+                print(f"[OK] {p.name}")
+                seen.add(rp)
+            except Exception as e:
+                print(f"[WARN] falha enviando {p} (nova tentativa no próximo ciclo): {e}")
         time.sleep(args.interval)
 
 if __name__ == "__main__":
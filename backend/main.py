@@ -1,12 +1,18 @@
 import asyncio
 import json
 from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+
+from .aggregates import SummaryIndex
+from .pubsub import make_pubsub
+from .snapshot import StateSnapshot
+from shared.wire import decode, fmt_for_mime
 
 # ------------------ util ------------------
 def now_iso() -> str:
@@ -23,7 +29,34 @@ def to_sse_event(data: dict) -> bytes:
 
 
 # ------------------ app ------------------
-app = FastAPI(title="Realtime Camera Backend", version="v1")
+# bus partilhado entre workers/réplicas (ver backend/pubsub.py, PUBSUB_URL)
+BUS = make_pubsub()
+
+# estado de todas as câmaras já serializado (GET /state), atualizado em _fanout
+SNAPSHOT = StateSnapshot(epoch=BUS.epoch)
+
+# resumos por câmara/produto e da loja, mantidos detecção a detecção a partir
+# dos eventos do bus (todos os workers aplicam os mesmos eventos, pela ordem do seq)
+SUMMARIES = SummaryIndex()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await BUS.start(_fanout)
+    # depois do start: o que chegar entretanto vem pelo bus (update ignora seq antigos)
+    states = await BUS.get_states()
+    for camera_id, event in list(states.items()):
+        if SNAPSHOT.seq_of(camera_id) >= int(event.get("seq") or 0) > 0:
+            del states[camera_id]         # já chegou uma versão mais recente pelo bus
+            continue
+        _apply_summaries(camera_id, event, incremental=False)
+        event["summary"] = SUMMARIES.camera_summary(camera_id)
+    SNAPSHOT.seed(states)
+    yield
+    await BUS.stop()
+
+
+app = FastAPI(title="Realtime Camera Backend", version="v1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,9 +64,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-LAST_STATE: Dict[str, Dict[str, Any]] = {}
+# subscritores SSE DESTE worker; o último estado vive no BUS
 SUBSCRIBERS: Dict[str, List[asyncio.Queue]] = defaultdict(list)
 
 
@@ -42,9 +76,44 @@ def health():
     return {"ok": True, "time": now_iso()}
 
 
+@app.get("/state")
+async def get_states(request: Request, cameras: Optional[str] = None, since: Optional[int] = None):
+    """
+    Estado de várias câmaras num só pedido.
+      ?cameras=6371,6373 → só essas (omitido = todas)
+      ?since=N           → só as que mudaram depois da versão N
+    Resposta: {"version": N, "cameras": {camera_id: frame_event}}; ETag +
+    If-None-Match → 304, gzip se o cliente aceitar.
+    """
+    cams = [c for c in cameras.split(",") if c] if cameras else None
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    etag = SNAPSHOT.etag(cams, since, gzipped)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(SNAPSHOT.body(cams, since, gzipped), media_type="application/json", headers=headers)
+
+
+@app.get("/summary")
+def get_summary(product_id: Optional[str] = None):
+    """Vista da loja: por produto (todas as câmaras) + totais."""
+    return {"totals": SUMMARIES.totals(), "products": SUMMARIES.product_summary(product_id)}
+
+
+def _with_summary(camera_id: str, state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # o "summary" do frame é mantido por cada worker (SUMMARIES), não vem do bus
+    if state is not None:
+        state["summary"] = SUMMARIES.camera_summary(camera_id)
+    return state
+
+
 @app.get("/state/{camera_id}")
-def get_state(camera_id: str):
-    return LAST_STATE.get(camera_id, {"camera_id": camera_id, "message": "sem dados ainda"})
+async def get_state(camera_id: str):
+    state = _with_summary(camera_id, await BUS.get_state(camera_id))
+    return state or {"camera_id": camera_id, "message": "sem dados ainda"}
 
 
 @app.get("/sse/cameras/{camera_id}")
@@ -52,8 +121,9 @@ async def sse_camera(camera_id: str):
     q: asyncio.Queue = asyncio.Queue()
     SUBSCRIBERS[camera_id].append(q)
 
-    if camera_id in LAST_STATE:
-        await q.put(LAST_STATE[camera_id])
+    state = _with_summary(camera_id, await BUS.get_state(camera_id))
+    if state is not None:
+        await q.put(state)
 
     async def event_stream():
         try:
@@ -70,7 +140,33 @@ async def sse_camera(camera_id: str):
 
 
 async def _broadcast(camera_id: str, event: Dict[str, Any]):
-    LAST_STATE[camera_id] = event
+    # publica uma vez; cada worker recebe via _fanout
+    await BUS.publish(camera_id, event)
+
+
+def _apply_summaries(camera_id: str, event: Dict[str, Any], incremental: bool = True):
+    """
+    Frame completo → substitui as ROIs da câmara. Parcial → só as ROIs que
+    chegaram neste evento ("changed"; o resto já foi aplicado antes, pela
+    ordem do seq). incremental=False (arranque) aplica sempre o estado todo.
+    """
+    try:
+        changed = event.get("changed") if incremental and event.get("partial") else None
+        if changed is None:
+            SUMMARIES.replace_camera(camera_id, event.get("detections") or [])
+            return
+        changed = set(changed)
+        for d in event.get("detections") or []:
+            if d["id"] in changed:
+                SUMMARIES.update(d)
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"[SUMMARY] ⚠️ evento de {camera_id} ignorado: {e}")
+
+
+async def _fanout(camera_id: str, event: Dict[str, Any]):
+    _apply_summaries(camera_id, event)
+    event["summary"] = SUMMARIES.camera_summary(camera_id)
+    SNAPSHOT.update(camera_id, event)
     for q in list(SUBSCRIBERS.get(camera_id, [])):
         await q.put(event)
 
@@ -79,10 +175,16 @@ async def _broadcast(camera_id: str, event: Dict[str, Any]):
 @app.post("/ingest")
 async def ingest(req: Request):
 
+    # negociação pelo Content-Type: JSON (orjson) ou msgpack colunar (shared/wire.py)
+    fmt = fmt_for_mime(req.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Content-Type suportado: application/json ou application/x-msgpack")
     try:
-        body = await req.json()
+        body = decode(await req.body(), fmt)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+        raise HTTPException(status_code=400, detail=f"payload {fmt} inválido: {e}")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="esperado objeto com detections[]")
 
     detections = body.get("detections")
     if not isinstance(detections, list):
@@ -98,6 +200,8 @@ async def ingest(req: Request):
     if not by_cam:
         return {"status": "ok", "cameras": 0}
 
+    partial = bool(body.get("partial"))
+
     emitted = 0
 
     # processar cada câmara
@@ -136,6 +240,7 @@ async def ingest(req: Request):
                 "score": score,
                 "status": status,
                 "confidence": float(d.get("confidence", 0.0)),
+                "scored_by": d.get("scored_by", "model"),
                 "insights": d.get("insights"),
                 "quad": quad,
                 "ui": {
@@ -148,56 +253,11 @@ async def ingest(req: Request):
                 }
             })
 
-        # ---- resumo por produto ----
-        summary_map: Dict[str, Dict[str, Any]] = {}
-        for e in enriched:
-            pid = e["product_id"]
-            rec = summary_map.setdefault(pid, {
-                "product_id": pid,
-                "product_name": e["product_name"],
-                "count": 0,
-                "sum_score": 0,
-                "sum_quantidade": 0,
-                "sum_qualidade": 0,
-                "sum_organizacao": 0,
-                "sum_contexto": 0,
-                "min_score": 10**9,
-                "max_score": -10**9,
-                "empties": 0, "lows": 0, "oks": 0, "fulls": 0,
-            })
-
-            sc = e["score"]
-            rec["count"] += 1
-            rec["sum_score"] += sc
-            rec["min_score"] = min(rec["min_score"], sc)
-            rec["max_score"] = max(rec["max_score"], sc)
-            rec["sum_quantidade"] += e.get("quantidade_pct") or 0
-            rec["sum_qualidade"] += e.get("qualidade_pct") or 0
-            rec["sum_organizacao"] += e.get("organizacao_pct") or 0
-            rec["sum_contexto"] += e.get("contexto_pct") or 0
-            rec[{"empty":"empties","low":"lows","ok":"oks","full":"fulls"}[e["status"]]] += 1
-
-        summary = []
-        for rec in summary_map.values():
-            count = rec["count"]
-            summary.append({
-                "product_id": rec["product_id"],
-                "product_name": rec["product_name"],
-                "count": rec["count"],
-                "avg_score": rec["sum_score"] / count,
-                "min_score": rec["min_score"],
-                "max_score": rec["max_score"],
-                "avg_quantidade_pct": rec["sum_quantidade"] / count,
-                "avg_qualidade_pct": rec["sum_qualidade"] / count,
-                "avg_organizacao_pct": rec["sum_organizacao"] / count,
-                "avg_contexto_pct": rec["sum_contexto"] / count,
-                "empties": rec["empties"],
-                "lows": rec["lows"],
-                "oks": rec["oks"],
-                "fulls": rec["fulls"],
-            })
-
         # ---- FrameEvent (FALTAVA!) ----
+        # partial=true (emissão antecipada do agente): o bus junta estas
+        # detecções às já conhecidas da câmara em vez de substituir o frame;
+        # "changed" diz a cada worker que ROIs atualizar no resumo, que é
+        # preenchido em _fanout (backend/aggregates.py)
         frame_event = {
             "type": "frame",
             "version": "1.0",
@@ -205,8 +265,10 @@ async def ingest(req: Request):
             "observed_at": now_iso(),
             "image": {},
             "detections": enriched,
-            "summary": summary,
         }
+        if partial:
+            frame_event["partial"] = True
+            frame_event["changed"] = [e["id"] for e in enriched]
 
         await _broadcast(camera_id, frame_event)
         emitted += 1
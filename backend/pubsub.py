@@ -0,0 +1,328 @@
+# backend/pubsub.py
+# -------------------------------------------------------------------------
+# Pub/sub entre workers/réplicas do backend
+#
+# O /ingest publica UMA vez; cada worker recebe o evento pelo bus e faz
+# fan-out para os seus próprios subscritores SSE. O último estado de cada
+# câmara fica num store partilhado (get_state / get_states).
+#
+# Cada evento publicado leva um "seq" crescente atribuído pelo bus (igual em
+# todos os workers): é o cursor de versão do GET /state ("mudanças desde N").
+#
+# Eventos com "partial": true (emissão antecipada do agente) são juntados ao
+# estado anterior da câmara DENTRO do bus, na mesma operação atómica que o
+# grava: dois parciais da mesma câmara em workers diferentes não se pisam.
+#
+# PUBSUB_URL:
+#   ""/"memory://"          → em processo (1 worker, comportamento original)
+#   "sqlite:///caminho.db"  → stand-in local: vários workers no mesmo host
+#   "redis://host:6379/0"   → broker Redis (pip install redis)
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import asyncio, json, os, random, sqlite3, time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+Deliver = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def merge_partial(prev: Optional[Dict[str, Any]], event: Dict[str, Any]) -> Dict[str, Any]:
+    """partial=true → detecções do estado anterior + as novas (por "id"); senão o evento tal como está."""
+    if not prev or not event.get("partial"):
+        return event
+    merged = {d["id"]: d for d in prev.get("detections") or []}
+    merged.update({d["id"]: d for d in event.get("detections") or []})
+    return dict(event, detections=list(merged.values()))
+
+
+class PubSub(ABC):
+    """Interface comum. `deliver(camera_id, event)` é chamado em cada worker."""
+
+    epoch = ""      # identifica a sequência de "seq" (só muda se o contador recomeçar)
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def publish(self, camera_id: str, event: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    async def get_state(self, camera_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_states(self) -> Dict[str, Dict[str, Any]]:
+        """Último estado de todas as câmaras (arranque do snapshot)."""
+
+
+# ------------------ em processo ------------------
+class LocalPubSub(PubSub):
+    def __init__(self):
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self._seq = 0
+        self.epoch = f"{int(time.time()):x}."
+
+    async def publish(self, camera_id, event):
+        event = merge_partial(self.state.get(camera_id), event)
+        self._seq += 1
+        event["seq"] = self._seq
+        self.state[camera_id] = event
+        await self._deliver(camera_id, event)
+
+    async def get_state(self, camera_id):
+        return self.state.get(camera_id)
+
+    async def get_states(self):
+        return dict(self.state)
+
+
+# ------------------ SQLite (stand-in local) ------------------
+class SqlitePubSub(PubSub):
+    """
+    Log de eventos numa tabela SQLite partilhada. Cada worker faz polling
+    de `seq > último visto` e entrega localmente. Eventos com mais de
+    `retention_s` segundos são apagados (o estado fica na tabela `state`).
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.1, retention_s: float = 300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_s = retention_s
+        self._task: Optional[asyncio.Task] = None
+        self._last_seq = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+                    camera_id  TEXT NOT NULL,
+                    payload    TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    camera_id TEXT PRIMARY KEY,
+                    payload   TEXT NOT NULL
+                )
+            """)
+            # contador do "seq" (não usa o seq de events: esse é apagado pela retenção)
+            db.execute("CREATE TABLE IF NOT EXISTS version (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO version(id, seq) VALUES (1, 0)")
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    # --- operações bloqueantes (correm em thread) ---
+    def _publish_sync(self, camera_id: str, event: Dict[str, Any]):
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            if event.get("partial"):
+                row = db.execute("SELECT payload FROM state WHERE camera_id = ?", (camera_id,)).fetchone()
+                event = merge_partial(json.loads(row[0]) if row else None, event)
+            db.execute("UPDATE version SET seq = seq + 1 WHERE id = 1")
+            event["seq"] = db.execute("SELECT seq FROM version WHERE id = 1").fetchone()[0]
+            payload = json.dumps(event, ensure_ascii=False)
+            db.execute(
+                "INSERT INTO events(camera_id, payload, created_at) VALUES (?,?,?)",
+                (camera_id, payload, now),
+            )
+            db.execute(
+                "INSERT INTO state(camera_id, payload) VALUES (?,?) "
+                "ON CONFLICT(camera_id) DO UPDATE SET payload = excluded.payload",
+                (camera_id, payload),
+            )
+            db.execute("DELETE FROM events WHERE created_at < ?", (now - self.retention_s,))
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _fetch_since(self, seq: int):
+        db = self._connect()
+        try:
+            return db.execute(
+                "SELECT seq, camera_id, payload FROM events WHERE seq > ? ORDER BY seq",
+                (seq,),
+            ).fetchall()
+        finally:
+            db.close()
+
+    def _max_seq(self) -> int:
+        db = self._connect()
+        try:
+            return db.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+        finally:
+            db.close()
+
+    def _state_sync(self, camera_id: str) -> Optional[str]:
+        db = self._connect()
+        try:
+            row = db.execute("SELECT payload FROM state WHERE camera_id = ?", (camera_id,)).fetchone()
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    def _states_sync(self):
+        db = self._connect()
+        try:
+            return db.execute("SELECT camera_id, payload FROM state").fetchall()
+        finally:
+            db.close()
+
+    # --- interface ---
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._last_seq = await asyncio.to_thread(self._max_seq)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _poll(self):
+        while True:
+            try:
+                rows = await asyncio.to_thread(self._fetch_since, self._last_seq)
+                for seq, camera_id, payload in rows:
+                    self._last_seq = seq
+                    await self._deliver(camera_id, json.loads(payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[PUBSUB] ⚠️ polling falhou: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def publish(self, camera_id, event):
+        await asyncio.to_thread(self._publish_sync, camera_id, event)
+
+    async def get_state(self, camera_id):
+        payload = await asyncio.to_thread(self._state_sync, camera_id)
+        return json.loads(payload) if payload else None
+
+    async def get_states(self):
+        rows = await asyncio.to_thread(self._states_sync)
+        return {camera_id: json.loads(payload) for camera_id, payload in rows}
+
+
+# ------------------ Redis ------------------
+# seq, estado e publish numa só operação atómica no servidor: o seq é
+# injetado à cabeça do JSON já serializado (ARGV[1] = '{...}' sem "seq")
+_PUBLISH_LUA = """
+local seq = redis.call('INCR', KEYS[2])
+local payload = '{"seq":' .. seq .. ',' .. string.sub(ARGV[1], 2)
+redis.call('SET', KEYS[1], payload)
+redis.call('PUBLISH', ARGV[3], '{"camera_id":' .. ARGV[2] .. ',"event":' .. payload .. '}')
+return seq
+"""
+
+
+class RedisPubSub(PubSub):
+    CHANNEL = "hotshelf:events"
+    STATE_KEY = "hotshelf:state:{}"
+    SEQ_KEY = "hotshelf:seq"
+
+    def __init__(self, url: str, max_retries: int = 20, client=None):
+        try:
+            import redis.asyncio as aioredis
+            from redis.exceptions import WatchError
+        except ImportError:
+            raise RuntimeError("PUBSUB_URL=redis://… requer o pacote 'redis' (pip install redis)")
+        self._watch_error = WatchError
+        self.redis = client if client is not None else aioredis.from_url(url, decode_responses=True)
+        self.max_retries = max_retries
+        self._publish_script = self.redis.register_script(_PUBLISH_LUA)
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(self.CHANNEL)
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.CHANNEL)
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.redis.aclose()
+
+    async def _listen(self):
+        async for msg in self._pubsub.listen():
+            if msg.get("type") != "message":
+                continue
+            try:
+                data = json.loads(msg["data"])
+                await self._deliver(data["camera_id"], data["event"])
+            except Exception as e:
+                print(f"[PUBSUB] ⚠️ mensagem inválida: {e}")
+
+    def _script_args(self, camera_id: str, event: Dict[str, Any]):
+        body = {k: v for k, v in event.items() if k != "seq"}
+        return ([self.STATE_KEY.format(camera_id), self.SEQ_KEY],
+                [json.dumps(body, ensure_ascii=False), json.dumps(camera_id), self.CHANNEL])
+
+    async def publish(self, camera_id, event):
+        if not event.get("partial"):
+            await self._publish_script(*self._script_args(camera_id, event))
+            return
+        # parcial: junta ao estado anterior; WATCH só da chave DESTA câmara
+        key = self.STATE_KEY.format(camera_id)
+        async with self.redis.pipeline(transaction=True) as p:
+            for attempt in range(self.max_retries):
+                try:
+                    await p.watch(key)
+                    prev = await p.get(key)
+                    ev = merge_partial(json.loads(prev) if prev else None, event)
+                    p.multi()
+                    await self._publish_script(*self._script_args(camera_id, ev), client=p)
+                    await p.execute()
+                    return
+                except self._watch_error:
+                    # outro parcial da mesma câmara ganhou: recua um pouco (jitter) e repete
+                    await asyncio.sleep(random.uniform(0, min(0.2, 0.002 * 2 ** attempt)))
+        raise RuntimeError(f"publish de {camera_id}: estado em conflito após {self.max_retries} tentativas")
+
+    async def get_state(self, camera_id):
+        payload = await self.redis.get(self.STATE_KEY.format(camera_id))
+        return json.loads(payload) if payload else None
+
+    async def get_states(self):
+        prefix = self.STATE_KEY.format("")
+        keys = [k async for k in self.redis.scan_iter(match=prefix + "*")]
+        values = await self.redis.mget(keys) if keys else []
+        return {k[len(prefix):]: json.loads(v) for k, v in zip(keys, values) if v}
+
+
+def make_pubsub(url: Optional[str] = None) -> PubSub:
+    url = os.getenv("PUBSUB_URL", "") if url is None else url
+    if not url or url.startswith("memory://"):
+        return LocalPubSub()
+    if url.startswith("sqlite:///"):
+        return SqlitePubSub(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisPubSub(url)
+    raise RuntimeError(f"PUBSUB_URL não suportado: {url}")
@@ -0,0 +1,337 @@
+# backend/replay.py
+# -------------------------------------------------------------------------
+# Replay / geração de carga para o backend
+#
+# Envia para /ingest os payloads históricos de data/outputs (ficheiros
+# inválidos são ignorados) e, com --cameras, réplicas sintéticas até
+# milhares de câmaras, a um ritmo fixo. Em paralelo mantém --subscribers
+# ligações SSE abertas (/sse/cameras/{id}) e mede quanto tempo cada frame
+# demora desde o POST até chegar a cada cliente.
+#
+# Cada POST marca as detecções com image_name="replay-<run>:<n>" (campo que
+# o backend passa tal e qual), é assim que o cliente SSE sabe a que envio
+# pertence o evento.
+#
+# Uso:
+#   python -m backend.replay --spawn --cameras 2000 --rate 200 --duration 30 --subscribers 1000
+#   python -m backend.replay --backend http://localhost:8000 --pid 1234 --rate 50
+# --spawn arranca o uvicorn numa porta livre (com --workers) e mede o RSS dele.
+# -------------------------------------------------------------------------
+
+import argparse, asyncio, glob, json, os, random, socket, subprocess, sys, tempfile, time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from shared import wire
+
+
+# ------------------ payloads ------------------
+def load_cameras(pattern: str) -> Dict[str, List[Dict]]:
+    """camera_id → detecções (do ficheiro mais recente em que a câmara aparece)."""
+    cams: Dict[str, List[Dict]] = {}
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime):
+        try:
+            dets = wire.read_file(path).get("detections") or []
+        except Exception as e:
+            print(f"[REPLAY] ignorado {path}: {e}")
+            continue
+        by_cam = defaultdict(list)
+        for d in dets:
+            if isinstance(d, dict) and d.get("camera_id") not in (None, ""):
+                by_cam[str(d["camera_id"])].append(d)
+        cams.update(by_cam)
+    return cams
+
+def scale_cameras(base: Dict[str, List[Dict]], n: int) -> Dict[str, List[Dict]]:
+    """Replica as câmaras reais até n (ids '<original>-<k>')."""
+    if n <= len(base):
+        return base
+    ids = sorted(base)
+    out = dict(base)
+    for k in range(len(base), n):
+        src = ids[k % len(ids)]
+        cam = f"{src}-{k}"
+        out[cam] = [dict(d, camera_id=cam) for d in base[src]]
+    return out
+
+def make_payload(dets: List[Dict], tag: str, rnd: random.Random) -> Dict:
+    """Cópia das detecções com valores ligeiramente diferentes (o estado muda a cada envio)."""
+    out = []
+    for d in dets:
+        d = dict(d, image_name=tag)
+        for k in ("quantidade_pct", "pontuacao_total"):
+            if isinstance(d.get(k), (int, float)):
+                d[k] = max(0, min(100, int(d[k]) + rnd.randint(-5, 5)))
+        out.append(d)
+    return {"detections": out}
+
+
+# ------------------ métricas ------------------
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+def rss_mb(pid: int) -> float:
+    """RSS do processo e dos filhos (workers do uvicorn), via /proc."""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            pids += [int(x) for x in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024
+
+
+class Stats:
+    def __init__(self):
+        self.tag = f"replay-{os.getpid()}-{int(time.time())}:"   # distingue execuções anteriores
+        self.sent: Dict[int, float] = {}       # post_id → perf_counter do envio
+        self.post_cam: Dict[int, str] = {}
+        self.rtt: List[float] = []
+        self.delivery: List[float] = []        # POST → cliente SSE
+        self.fanout: List[float] = []          # observed_at (backend) → cliente SSE
+        self.errors = 0
+        self.lag: List[float] = []             # atraso do envio face ao ritmo pedido
+        self.rss: List[float] = []
+        self.dets = 0
+
+
+# ------------------ clientes ------------------
+async def subscriber(client: httpx.AsyncClient, base: str, cam: str, stats: Stats, ready: asyncio.Event):
+    try:
+        async with client.stream("GET", f"{base}/sse/cameras/{cam}", timeout=None) as resp:
+            ready.set()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                now = time.perf_counter()
+                wall = time.time()
+                ev = json.loads(line[6:])
+                dets = ev.get("detections") or []
+                name = str(dets[0].get("image_name") or "") if dets else ""
+                if not name.startswith(stats.tag):
+                    continue                  # estado anterior a esta execução
+                t0 = stats.sent.get(int(name[len(stats.tag):]))
+                if t0 is not None:
+                    stats.delivery.append(now - t0)
+                try:
+                    stats.fanout.append(wall - datetime.fromisoformat(ev["observed_at"]).timestamp())
+                except (KeyError, ValueError):
+                    pass
+    except (httpx.HTTPError, asyncio.CancelledError):
+        ready.set()
+
+async def post_one(client: httpx.AsyncClient, url: str, cam: str, dets: List[Dict], post_id: int,
+                   fmt: str, stats: Stats, rnd: random.Random, sem: asyncio.Semaphore):
+    async with sem:
+        data = wire.encode(make_payload(dets, f"{stats.tag}{post_id}", rnd), fmt)
+        t0 = time.perf_counter()
+        stats.sent[post_id] = t0
+        stats.post_cam[post_id] = cam
+        try:
+            r = await client.post(url, content=data, headers={"Content-Type": wire.mime_for(fmt)})
+            r.raise_for_status()
+            stats.rtt.append(time.perf_counter() - t0)
+            stats.dets += len(dets)
+        except httpx.HTTPError as e:
+            stats.errors += 1
+            if stats.errors <= 5:
+                print(f"[REPLAY] ⚠️ POST falhou: {e!r}")
+
+async def sample_rss(pid: Optional[int], stats: Stats, stop: asyncio.Event):
+    while pid and not stop.is_set():
+        stats.rss.append(rss_mb(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args, cams: Dict[str, List[Dict]], base: str, pid: Optional[int]) -> Dict:
+    stats = Stats()
+    rnd = random.Random(args.seed)
+    cam_ids = sorted(cams)
+    limits = httpx.Limits(max_connections=args.subscribers + args.concurrency + 8,
+                          max_keepalive_connections=args.concurrency + 8)
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        rss_task = asyncio.create_task(sample_rss(pid, stats, stop))
+
+        # subscritores repartidos pelas câmaras
+        sub_cams = [cam_ids[i % len(cam_ids)] for i in range(args.subscribers)]
+        readies = [asyncio.Event() for _ in sub_cams]
+        subs = [asyncio.create_task(subscriber(client, base, c, stats, e)) for c, e in zip(sub_cams, readies)]
+        if readies:
+            await asyncio.wait_for(asyncio.gather(*(e.wait() for e in readies)), 60)
+        rss_idle = rss_mb(pid) if pid else 0.0
+        print(f"[REPLAY] {len(subs)} subscritores SSE ligados; a enviar {args.rate}/s durante {args.duration}s "
+              f"({len(cam_ids)} câmaras)")
+
+        sem = asyncio.Semaphore(args.concurrency)
+        posts = []
+        total = int(args.rate * args.duration)
+        t_start = time.perf_counter()
+        for i in range(total):
+            due = t_start + i / args.rate
+            wait = due - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            else:
+                stats.lag.append(-wait)
+            cam = cam_ids[i % len(cam_ids)]
+            posts.append(asyncio.create_task(
+                post_one(client, f"{base}/ingest", cam, cams[cam], i, args.format, stats, rnd, sem)))
+        await asyncio.gather(*posts)
+        t_sent = time.perf_counter() - t_start
+
+        await asyncio.sleep(args.drain)        # eventos ainda a caminho
+        elapsed = time.perf_counter() - t_start
+        for t in subs:
+            t.cancel()
+        await asyncio.gather(*subs, return_exceptions=True)
+        stop.set()
+        await rss_task
+
+    subs_per_cam = defaultdict(int)
+    for c in sub_cams:
+        subs_per_cam[c] += 1
+    expected = sum(subs_per_cam.get(stats.post_cam[i], 0) for i in stats.sent)
+    ok = len(stats.rtt)
+    return {
+        "cameras": len(cam_ids),
+        "subscribers": len(sub_cams),
+        "posts": total,
+        "posts_ok": ok,
+        "post_errors": stats.errors,
+        "send_s": t_sent,
+        "elapsed_s": elapsed,
+        "posts_per_s": ok / t_sent if t_sent else 0.0,
+        "detections_per_s": stats.dets / t_sent if t_sent else 0.0,
+        "send_lag_max_ms": max(stats.lag, default=0.0) * 1000,
+        "deliveries": len(stats.delivery),
+        "deliveries_expected": expected,
+        "deliveries_per_s": len(stats.delivery) / elapsed if elapsed else 0.0,
+        "post_rtt_ms": _pcts(stats.rtt),
+        "delivery_ms": _pcts(stats.delivery),
+        "fanout_ms": _pcts(stats.fanout),
+        "backend_rss_mb": {
+            "idle": rss_idle,
+            "peak": max(stats.rss, default=0.0),
+            "end": stats.rss[-1] if stats.rss else 0.0,
+        } if pid else None,
+    }
+
+def _pcts(vals: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(vals),
+        "p50": percentile(vals, 50) * 1000,
+        "p95": percentile(vals, 95) * 1000,
+        "p99": percentile(vals, 99) * 1000,
+        "max": max(vals, default=0.0) * 1000,
+    }
+
+
+# ------------------ backend local ------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_backend(workers: int) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ)
+    if workers > 1 and not env.get("PUBSUB_URL"):
+        # vários workers precisam de um bus partilhado (backend/pubsub.py)
+        env["PUBSUB_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='hotshelf-replay-')}/pubsub.db"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("backend não arrancou")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", default="data/outputs/roi_response_*", help="glob dos payloads históricos")
+    ap.add_argument("--backend", default="http://localhost:8000")
+    ap.add_argument("--spawn", action="store_true", help="arranca um uvicorn local e mede o RSS dele")
+    ap.add_argument("--workers", type=int, default=1, help="workers do uvicorn com --spawn")
+    ap.add_argument("--pid", type=int, default=0, help="PID do backend para medir RSS (sem --spawn)")
+    ap.add_argument("--cameras", type=int, default=0, help="escala até N câmaras sintéticas")
+    ap.add_argument("--rate", type=float, default=20.0, help="POSTs por segundo (1 câmara por POST)")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--subscribers", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=64, help="POSTs em voo no máximo")
+    ap.add_argument("--format", choices=tuple(wire.FORMATS), default="json")
+    ap.add_argument("--drain", type=float, default=2.0, help="s à espera de eventos no fim")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="", help="grava o relatório em JSON")
+    args = ap.parse_args()
+
+    cams = load_cameras(args.files)
+    if not cams:
+        print(f"[REPLAY] nenhum payload válido em {args.files}")
+        return
+    cams = scale_cameras(cams, args.cameras)
+
+    proc, base, pid = None, args.backend.rstrip("/"), args.pid or None
+    if args.spawn:
+        proc, base = spawn_backend(args.workers)
+        pid = proc.pid
+    try:
+        report = asyncio.run(run(args, cams, base, pid))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    print("\n================ REPLAY ================")
+    print(f"câmaras: {report['cameras']}  subscritores: {report['subscribers']}")
+    print(f"POSTs: {report['posts_ok']}/{report['posts']} ok ({report['post_errors']} erros) → "
+          f"{report['posts_per_s']:.1f}/s, {report['detections_per_s']:.0f} detecções/s "
+          f"(atraso máx. do envio {report['send_lag_max_ms']:.0f} ms)")
+    print(f"entregas SSE: {report['deliveries']}/{report['deliveries_expected']} "
+          f"({report['deliveries_per_s']:.0f}/s)")
+    print(f"\n{'latência':<14}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ("post_rtt_ms", "delivery_ms", "fanout_ms"):
+        st = report[name]
+        print(f"{name[:-3]:<14}{st['n']:>8}{st['p50']:>10.1f}{st['p95']:>10.1f}{st['p99']:>10.1f}{st['max']:>10.1f}")
+    if report["backend_rss_mb"]:
+        m = report["backend_rss_mb"]
+        print(f"\nRSS backend: {m['idle']:.0f} MB em repouso, pico {m['peak']:.0f} MB, fim {m['end']:.0f} MB")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nrelatório → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# backend/snapshot.py
+# -------------------------------------------------------------------------
+# Snapshot do estado de todas as câmaras para o GET /state
+#
+# Cada worker mantém o último evento de cada câmara JÁ SERIALIZADO (bytes
+# JSON), atualizado quando o bus entrega um evento (_fanout). O corpo da
+# resposta é montado juntando esses bytes — nunca se volta a serializar um
+# frame — e cada corpo montado (completo, filtrado por câmaras ou "since";
+# JSON ou gzip) fica em cache até à próxima mudança de estado.
+#
+#   ETag  → '"<seq máx. das câmaras pedidas>-<crc das câmaras pedidas>[-gz]"'
+#           (um ETag por codificação: o corpo gzip não é o mesmo recurso)
+#   since → só câmaras com seq > since (o cliente guarda "version" da
+#           resposta anterior e pede "mudanças desde N"); um cursor maior
+#           que a versão atual (bus reiniciado) devolve tudo
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import gzip, json, zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from shared.wire import encode
+
+
+class StateSnapshot:
+    def __init__(self, epoch: str = "", gzip_level: int = 5, max_bodies: int = 64):
+        self.epoch = epoch          # muda quando o seq recomeça (bus em memória)
+        self.gzip_level = gzip_level
+        self.max_bodies = max_bodies
+        self.version = 0                                   # maior seq visto
+        self._cams: Dict[str, Tuple[int, bytes]] = {}      # camera_id → (seq, JSON)
+        # (câmaras, since, gzip) → corpo; esvaziada a cada mudança de estado
+        self._bodies: "OrderedDict[Tuple, bytes]" = OrderedDict()
+
+    def update(self, camera_id: str, event: Dict[str, Any]):
+        seq = int(event.get("seq") or 0)
+        cur = self._cams.get(camera_id)
+        if cur is not None and seq and seq < cur[0]:
+            return                       # evento atrasado (ex.: arranque + polling)
+        self._cams[camera_id] = (seq, encode(event, "json"))
+        self.version = max(self.version, seq)
+        self._bodies.clear()
+
+    def seed(self, states: Dict[str, Dict[str, Any]]):
+        for camera_id, event in states.items():
+            self.update(camera_id, event)
+
+    def seq_of(self, camera_id: str) -> int:
+        cur = self._cams.get(camera_id)
+        return cur[0] if cur else 0
+
+    def __len__(self) -> int:
+        return len(self._cams)
+
+    # ------------------------------------------------------------------
+    def _select(self, cameras: Optional[Iterable[str]]):
+        if cameras is None:
+            return sorted(self._cams.items())
+        return [(c, self._cams[c]) for c in sorted(set(cameras)) if c in self._cams]
+
+    def etag(self, cameras: Optional[Iterable[str]] = None, since: Optional[int] = None,
+             gzipped: bool = False) -> str:
+        items = self._select(cameras)
+        top = max((seq for _c, (seq, _b) in items), default=0)
+        key = ",".join(c for c, _ in items) + f"|{since if since is not None else ''}"
+        return f'"{self.epoch}{top}-{zlib.crc32(key.encode("utf-8")):08x}{"-gz" if gzipped else ""}"'
+
+    def body(self, cameras: Optional[Iterable[str]] = None, since: Optional[int] = None,
+             gzipped: bool = False) -> bytes:
+        """{"version": N, "cameras": {camera_id: frame_event, ...}}"""
+        if since is not None and since > self.version:
+            since = None
+        key = (None if cameras is None else tuple(sorted(set(cameras))), since, gzipped)
+        data = self._bodies.get(key)
+        if data is not None:
+            self._bodies.move_to_end(key)
+            return data
+        if gzipped:
+            data = gzip.compress(self.body(cameras, since), self.gzip_level)
+        else:
+            data = self._assemble(
+                (c, b) for c, (seq, b) in self._select(key[0])
+                if since is None or seq > since
+            )
+        self._bodies[key] = data
+        if len(self._bodies) > self.max_bodies:
+            self._bodies.popitem(last=False)
+        return data
+
+    def _assemble(self, items) -> bytes:
+        parts = [json.dumps(c, ensure_ascii=False).encode("utf-8") + b":" + b for c, b in items]
+        return b'{"version":%d,"cameras":{' % self.version + b",".join(parts) + b"}}"
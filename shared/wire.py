@@ -0,0 +1,177 @@
+# shared/wire.py
+# -------------------------------------------------------------------------
+# Formato de transporte das detections (agente → data/ → file_poller → /ingest)
+#
+#   json    → {"detections": [...]} (orjson quando disponível)
+#   msgpack → colunar: cada chave aparece UMA vez, valores em listas
+#             {"v": 1, "n": N, "cols": {chave: [v0, v1, ...]}, "absent": {...}}
+#             roi_quad_px vai achatado em 8 números (tl, tr, br, bl); as
+#             linhas achatadas ficam marcadas em "flat" ({chave: [índices]}),
+#             o resto da coluna passa como está.
+#             Outras chaves do topo (ex.: "partial") vão em "meta".
+#
+# Partilhado pelo agente e pelo backend (as duas imagens copiam shared/).
+# -------------------------------------------------------------------------
+
+from __future__ import annotations
+import json, os
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # fallback para json da stdlib
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SCHEMA_VERSION = 2        # v1: sem "flat", qualquer lista de 8 era um quad
+
+JSON_MIME = "application/json"
+MSGPACK_MIME = "application/x-msgpack"
+
+FORMATS = {
+    "json":    {"mime": JSON_MIME,    "ext": ".json"},
+    "msgpack": {"mime": MSGPACK_MIME, "ext": ".msgpack"},
+}
+
+_QUAD_KEYS = ("top_left", "top_right", "bottom_right", "bottom_left")
+_FLAT_KEYS = ("roi_quad_px",)
+
+
+# ------------------ helpers ------------------
+def ext_for(fmt: str) -> str:
+    return FORMATS[fmt]["ext"]
+
+def mime_for(fmt: str) -> str:
+    return FORMATS[fmt]["mime"]
+
+def fmt_for_path(path: str) -> str:
+    return "msgpack" if str(path).endswith(".msgpack") else "json"
+
+def fmt_for_mime(content_type: Optional[str]) -> Optional[str]:
+    """Content-Type → formato; None se não suportado. Vazio assume JSON."""
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct in ("", JSON_MIME, "text/json"):
+        return "json"
+    if ct in (MSGPACK_MIME, "application/msgpack", "application/vnd.msgpack"):
+        return "msgpack"
+    return None
+
+def _require_msgpack():
+    if msgpack is None:
+        raise RuntimeError("formato msgpack requer o pacote 'msgpack' (pip install msgpack)")
+
+
+# ------------------ colunar ------------------
+def _flat_quad(q) -> Optional[list]:
+    """Quad "normal" (só os 4 cantos, 2 números cada) → 8 números; None se não for."""
+    if isinstance(q, dict) and set(q) == set(_QUAD_KEYS):
+        pts = [q[k] for k in _QUAD_KEYS]
+        if all(isinstance(p, list) and len(p) == 2 for p in pts):
+            flat = [c for p in pts for c in p]
+            if all(isinstance(c, (int, float)) and not isinstance(c, bool) for c in flat):
+                return flat
+    return None
+
+def _unflat_quad(v) -> Any:
+    return {k: [v[2*i], v[2*i+1]] for i, k in enumerate(_QUAD_KEYS)}
+
+def to_columns(detections: List[Dict[str, Any]]) -> Dict[str, Any]:
+    keys: List[str] = []
+    seen = set()
+    for d in detections:
+        for k in d:
+            if k not in seen:
+                seen.add(k)
+                keys.append(k)
+
+    cols: Dict[str, list] = {k: [] for k in keys}
+    absent: Dict[str, List[int]] = {}
+    flat: Dict[str, List[int]] = {}
+    for i, d in enumerate(detections):
+        for k in keys:
+            if k not in d:
+                absent.setdefault(k, []).append(i)
+                cols[k].append(None)
+                continue
+            v = _flat_quad(d[k]) if k in _FLAT_KEYS else None
+            if v is not None:
+                flat.setdefault(k, []).append(i)
+                cols[k].append(v)
+            else:
+                cols[k].append(d[k])
+
+    out = {"v": SCHEMA_VERSION, "n": len(detections), "cols": cols}
+    if absent:
+        out["absent"] = absent
+    if flat:
+        out["flat"] = flat
+    return out
+
+def from_columns(obj: Dict[str, Any]) -> List[Dict[str, Any]]:
+    v = obj.get("v")
+    if v not in (1, SCHEMA_VERSION):
+        raise ValueError(f"versão de schema não suportada: {v}")
+    n = obj.get("n", 0)
+    cols = obj.get("cols") or {}
+    absent = {k: set(ix) for k, ix in (obj.get("absent") or {}).items()}
+    flat = {k: set(ix) for k, ix in (obj.get("flat") or {}).items()}
+    if v == 1:   # ficheiros antigos: roi_quad_px com 8 elementos era sempre achatado
+        flat = {"roi_quad_px": {i for i, val in enumerate(cols.get("roi_quad_px") or ())
+                                if isinstance(val, list) and len(val) == 8}}
+
+    dets: List[Dict[str, Any]] = [{} for _ in range(n)]
+    for k, values in cols.items():
+        skip = absent.get(k, ())
+        unflat = flat.get(k, ())
+        for i, val in enumerate(values):
+            if i in skip:
+                continue
+            dets[i][k] = _unflat_quad(val) if i in unflat else val
+    return dets
+
+
+# ------------------ encode / decode ------------------
+def encode(payload: Dict[str, Any], fmt: str = "json", pretty: bool = False) -> bytes:
+    """payload = {"detections": [...]} → bytes no formato pedido."""
+    if fmt == "msgpack":
+        _require_msgpack()
+        obj = to_columns(payload.get("detections") or [])
+        meta = {k: v for k, v in payload.items() if k != "detections"}
+        if meta:
+            obj["meta"] = meta
+        return msgpack.packb(obj, use_bin_type=True)
+    if fmt != "json":
+        raise ValueError(f"formato desconhecido: {fmt}")
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(payload, ensure_ascii=False, indent=2 if pretty else None).encode("utf-8")
+
+def decode(data: bytes, fmt: str = "json") -> Dict[str, Any]:
+    """bytes → {"detections": [...]} (o payload JSON é devolvido tal como está)."""
+    if fmt == "msgpack":
+        _require_msgpack()
+        obj = msgpack.unpackb(data, raw=False)
+        out = dict(obj.get("meta") or {})
+        out["detections"] = from_columns(obj)
+        return out
+    if fmt != "json":
+        raise ValueError(f"formato desconhecido: {fmt}")
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def read_file(path) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return decode(f.read(), fmt_for_path(str(path)))
+
+def write_file(path, payload: Dict[str, Any], fmt: Optional[str] = None):
+    """Escrita atómica (tmp + os.replace): quem lê o diretório nunca vê um ficheiro a meio."""
+    fmt = fmt or fmt_for_path(str(path))
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode(payload, fmt, pretty=(fmt == "json")))
+    os.replace(tmp, path)
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")      # fakeredis precisa do lupa para EVAL/EVALSHA
+
+from backend.pubsub import RedisPubSub
+
+
+def _bus(server):
+    return RedisPubSub("redis://fake", client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+
+
+def _det(roi):
+    return {"id": f"6371|{roi}", "roi_id": roi}
+
+
+def test_redis_publish_assigns_seq_state_and_message_atomically():
+    async def run():
+        server = fakeredis.FakeServer()
+        bus = _bus(server)
+        sub = bus.redis.pubsub()
+        await sub.subscribe(RedisPubSub.CHANNEL)
+        await bus.publish("6371", {"camera_id": "6371", "detections": [_det("a")]})
+        await bus.publish("6373", {"camera_id": "6373", "detections": [], "seq": 99})
+        msgs = []
+        while len(msgs) < 2:
+            msg = await sub.get_message(ignore_subscribe_messages=True, timeout=1)
+            if msg:
+                msgs.append(json.loads(msg["data"]))
+        states = await bus.get_states()
+        await sub.aclose()
+        await bus.stop()
+        return msgs, states
+
+    msgs, states = asyncio.run(run())
+    assert [m["event"]["seq"] for m in msgs] == [1, 2]
+    assert [m["camera_id"] for m in msgs] == ["6371", "6373"]
+    assert states["6371"]["seq"] == 1 and states["6373"]["seq"] == 2
+    assert states["6373"]["detections"] == []
+
+
+def test_redis_concurrent_partials_are_all_merged():
+    async def run():
+        server = fakeredis.FakeServer()
+        buses = [_bus(server) for _ in range(4)]
+        await asyncio.gather(*(
+            buses[i % 4].publish("6371", {"camera_id": "6371", "partial": True, "detections": [_det(f"r{i}")]})
+            for i in range(40)
+        ))
+        state = await buses[0].get_state("6371")
+        for bus in buses:
+            await bus.stop()
+        return state
+
+    state = asyncio.run(run())
+    assert len(state["detections"]) == 40
+    assert state["seq"] == 40
@@ -0,0 +1,29 @@
+import io
+
+from PIL import Image
+
+from app.snip import decode_for_rois, map_quad, warp_quad
+
+
+QUAD = {"top_left": [40, 40], "top_right": [360, 40], "bottom_right": [360, 360], "bottom_left": [40, 360]}
+
+
+def _png(mode: str) -> bytes:
+    img = Image.new("RGB", (400, 400), (200, 30, 30)).convert(mode)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_decode_for_rois_palette_png_reduced():
+    pil, origin, factor = decode_for_rois(_png("P"), [QUAD], min_side=50)
+    assert pil.mode == "RGB"
+    assert factor < 1.0
+    crop = warp_quad(pil, map_quad(QUAD, origin, factor))
+    assert max(crop.size) >= 50
+
+
+def test_decode_for_rois_full_resolution():
+    pil, origin, factor = decode_for_rois(_png("P"), [QUAD], min_side=0)
+    assert pil.mode == "RGB"
+    assert factor == 1.0